@@ -1,11 +1,13 @@
 """Component to embed HomeVentilationControl."""
 from __future__ import annotations
 
-import socket, errno
+import time
 import asyncio
+import contextlib
 from datetime import timedelta
 import logging
 from typing import Any
+from collections.abc import AsyncIterator, Container, Iterable
 from dataclasses import dataclass
 
 from .lib import *
@@ -19,33 +21,81 @@ from homeassistant.const import (
     CONF_UNIQUE_ID,
     CONF_HOST,
     CONF_PORT,
-    EVENT_HOMEASSISTANT_STARTED,
+    ATTR_ENTITY_ID,
+    ENTITY_MATCH_ALL,
+    ENTITY_MATCH_NONE,
+    EVENT_HOMEASSISTANT_STOP,
 )
-from homeassistant.core import HomeAssistant, callback
-from homeassistant.exceptions import ConfigEntryNotReady
+from homeassistant.core import HomeAssistant, ServiceCall, ServiceResponse, SupportsResponse, callback
+from homeassistant.exceptions import ConfigEntryNotReady, HomeAssistantError
+try:
+    from homeassistant.exceptions import ServiceValidationError
+except ImportError:
+    # Before Home Assistant 2023.11.
+    ServiceValidationError = HomeAssistantError
 from homeassistant.helpers.debounce import Debouncer
-from homeassistant.helpers import discovery_flow
+from homeassistant.helpers import area_registry as ar, config_validation as cv, device_registry as dr, discovery_flow, entity_registry as er
 from homeassistant.helpers.entity import DeviceInfo
 from homeassistant.helpers.event import async_track_time_interval
 from homeassistant.helpers.typing import ConfigType
 from homeassistant.helpers.update_coordinator import DataUpdateCoordinator, UpdateFailed
+import voluptuous as vol
 
-from .const import DOMAIN
+from .const import (
+    DOMAIN,
+    DATA_HUB,
+    DATA_DISCOVERY,
+    CONF_HUMIDITY_BOOST,
+    CONF_HUMIDITY_SETPOINT,
+    CONF_HUMIDITY_HYSTERESIS,
+    CONF_BOOST_FAN,
+    CONF_BOOST_LEVEL,
+    CONF_PROFILING,
+    DEFAULT_HUMIDITY_SETPOINT,
+    DEFAULT_HUMIDITY_HYSTERESIS,
+    DEFAULT_BOOST_FAN,
+    DEFAULT_BOOST_LEVEL,
+    ATTR_VALUE,
+    ATTR_POINTS,
+    ATTR_FAN,
+    ATTR_HOLD,
+    ATTR_DURATION,
+)
+from .cache import async_get_cache
+from .entity import DATA_LAYOUT, HISTORY_PATHS, subscribed_paths
 
 _LOGGER = logging.getLogger(__name__)
 
 PLATFORMS: Final = [Platform.SENSOR, Platform.BINARY_SENSOR, Platform.NUMBER]
 
 DISCOVERY_INTERVAL = timedelta(minutes=15)
+# Interval of active scans while packets to DEFAULT_PORT are listened to.
+PASSIVE_DISCOVERY_INTERVAL = timedelta(hours=2)
+# A discovered device gets a new discovery flow at most this often.
+DISCOVERY_FLOW_INTERVAL = timedelta(hours=1)
+# At most this many discovery flows are started per DISCOVERY_FLOW_INTERVAL,
+# as anyone on the network can send packets with new unique_ids.
+MAX_DISCOVERY_FLOWS = 32
+
+SERVICE_GET_HISTORY = "get_history"
+SERVICE_PROFILE = "profile"
+SERVICE_SET_FANS = "set_fans"
+ATTR_DEVICE_ID = "device_id"
+ATTR_AREA_ID = "area_id"
+ATTR_LABEL_ID = "label_id"
+ATTR_FLOOR_ID = "floor_id"
+ATTR_SAMPLES = "samples"
+ATTR_ENABLED = "enabled"
+ATTR_CAPTURE = "capture"
 
 
 @callback
 def async_trigger_discovery(
     hass: HomeAssistant,
-    discovered_devices: dict[str, HomeVentilationControlDevice],
+    discovered_devices: Iterable[HomeVentilationControlDevice],
 ) -> None:
     """Trigger config flows for discovered devices."""
-    for device in discovered_devices.values():
+    for device in discovered_devices:
         discovery_flow.async_create_flow(
             hass,
             DOMAIN,
@@ -54,64 +104,352 @@ def async_trigger_discovery(
         )
 
 
-async def async_discover_devices(hass: HomeAssistant, port: int = 0) -> dict[str, HomeVentilationControlDevice]:
-    """Discover HomeVentilationControl devices on configured network interfaces."""
-    broadcast_addresses = await network.async_get_ipv4_broadcast_addresses(hass)
-    tasks = [HomeVentilationControlDevice.discover(discovery_address = (str(address), port or HomeVentilationControlDevice.DEFAULT_PORT), broadcast = True) for address in broadcast_addresses]
-    discovered_devices: dict[str, HomeVentilationControlDevice] = {}
-    for coroutine in asyncio.as_completed(tasks):
+async def async_get_hub(hass: HomeAssistant) -> HomeVentilationControlHub:
+    """Get the UDP hub shared by all HomeVentilationControl devices.
+
+    The hub listens on DEFAULT_PORT if it is free, so that packets sent to
+    that port can be discovered passively, and on any port otherwise.
+    """
+    if (hub := hass.data.get(DATA_HUB)) is None:
+        hub = hass.data[DATA_HUB] = HomeVentilationControlHub()
+
+        @callback
+        def _async_close_hub(*_: Any) -> None:
+            hub.close()
+
+        hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, _async_close_hub)
         try:
-            device_list = await coroutine
-        except:
-            # FIXME: Logging?
-            pass
-        else:
-            for device in device_list.values():
-                discovered_devices[device.unique_id] = device
-    return discovered_devices
+            await hub.start(("0.0.0.0", HomeVentilationControlDevice.DEFAULT_PORT))
+        except HomeVentilationControlException as ex:
+            _LOGGER.info("Passive discovery is not available: %s", ex)
+    await hub.start()
+    return hub
+
+
+class HomeVentilationControlDiscoveryRegistry:
+    """The unique_ids which need no discovery flow: configured ones and those with a recent flow."""
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        self.hass = hass
+        # unique_id -> time.monotonic() of its latest discovery flow.
+        self._flows: dict[str, float] = {}
+        self._flows_capped = False
+
+    @callback
+    def async_known_ids(self) -> set[str]:
+        """Get the unique_ids of configured (or ignored) entries and recent flows."""
+        expired = time.monotonic() - DISCOVERY_FLOW_INTERVAL.total_seconds()
+        self._flows = {unique_id: t for unique_id, t in self._flows.items() if t > expired}
+        return {entry.unique_id for entry in self.hass.config_entries.async_entries(DOMAIN)} | self._flows.keys()
+
+    @callback
+    def async_discovered(self, device: HomeVentilationControlDevice) -> None:
+        """Start a discovery flow for the device unless it is known."""
+        if device.unique_id in self.async_known_ids():
+            return
+        if len(self._flows) >= MAX_DISCOVERY_FLOWS:
+            if not self._flows_capped:
+                self._flows_capped = True
+                _LOGGER.warning("More than %d devices discovered within %s; ignoring %s and further ones for now", MAX_DISCOVERY_FLOWS, DISCOVERY_FLOW_INTERVAL, device.unique_id)
+            return
+        self._flows_capped = False
+        self._flows[device.unique_id] = time.monotonic()
+        async_trigger_discovery(self.hass, [device])
+
+    @callback
+    def async_packet_received(self, hub: HomeVentilationControlHub, data: dict, peer) -> None:
+        """Start a discovery flow for an unsolicited packet from an unknown device."""
+        if data["unique_id"] not in hub.devices and "values" not in data and data["unique_id"] not in self.async_known_ids():
+            _LOGGER.debug("Passively discovered device %s at %s", data["unique_id"], peer)
+            self.async_discovered(HomeVentilationControlDevice(data, peer, hub))
+
+
+@callback
+def async_get_discovery_registry(hass: HomeAssistant) -> HomeVentilationControlDiscoveryRegistry:
+    if (registry := hass.data.get(DATA_DISCOVERY)) is None:
+        registry = hass.data[DATA_DISCOVERY] = HomeVentilationControlDiscoveryRegistry(hass)
+    return registry
+
+
+async def async_iter_discovered_devices(hass: HomeAssistant, port: int = 0, exclude: Container[str] = ()) -> AsyncIterator[HomeVentilationControlDevice]:
+    """Discover HomeVentilationControl devices on configured network interfaces.
+
+    Devices are yielded as soon as they reply on any interface. No devices
+    are created for replies from unique_ids in exclude.
+    """
+    try:
+        hub = await async_get_hub(hass)
+        broadcast_addresses = await network.async_get_ipv4_broadcast_addresses(hass)
+        discovery_addresses = [(str(address), port or HomeVentilationControlDevice.DEFAULT_PORT) for address in broadcast_addresses]
+        async with contextlib.aclosing(hub.discover_iter(discovery_addresses, broadcast = True, exclude = exclude)) as devices:
+            async for device in devices:
+                yield device
+    except HomeVentilationControlException as ex:
+        _LOGGER.warning("Discovery failed: %s", ex)
 
 
 async def async_setup(hass: HomeAssistant, config: ConfigType) -> bool:
     """Set up the HomeVentilationControl component."""
 
+    registry = async_get_discovery_registry(hass)
+
     async def _async_discovery(*_: Any) -> None:
-        async_trigger_discovery(hass, await async_discover_devices(hass))
+        async for device in async_iter_discovered_devices(hass, exclude = registry.async_known_ids()):
+            registry.async_discovered(device)
+
+    discovery_interval = DISCOVERY_INTERVAL
+    try:
+        hub = await async_get_hub(hass)
+    except HomeVentilationControlException as ex:
+        _LOGGER.warning("Cannot listen for devices: %s", ex)
+    else:
+        if hub.port == HomeVentilationControlDevice.DEFAULT_PORT:
+            # New devices are noticed from their packets; scans are only a fallback.
+            hub.watch(lambda data, peer: registry.async_packet_received(hub, data, peer))
+            discovery_interval = PASSIVE_DISCOVERY_INTERVAL
 
     asyncio.create_task(_async_discovery())
-    async_track_time_interval(hass, _async_discovery, DISCOVERY_INTERVAL)
+    async_track_time_interval(hass, _async_discovery, discovery_interval)
+
+    @callback
+    def _async_get_history(call: ServiceCall) -> ServiceResponse:
+        """Return the short-term history of a device."""
+        device = async_get_device(hass, call.data[ATTR_DEVICE_ID])
+        return device.history.samples(call.data.get(ATTR_SAMPLES)) if device.history else {}
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_GET_HISTORY,
+        _async_get_history,
+        schema = vol.Schema({
+            vol.Required(ATTR_DEVICE_ID): cv.string,
+            vol.Optional(ATTR_SAMPLES): cv.positive_int,
+        }),
+        supports_response = SupportsResponse.ONLY,
+    )
+
+    async def _async_profile(call: ServiceCall) -> ServiceResponse:
+        """Turn packet path timing on or off, or capture a cProfile of the packet path."""
+        hub = await async_get_hub(hass)
+        if ATTR_ENABLED in call.data:
+            async_enable_profiler(hass, call.data[ATTR_ENABLED])
+        if (capture := call.data.get(ATTR_CAPTURE)) is None:
+            return None
+        async_enable_profiler(hass, True)
+        profiler = hub.profiler
+        path = hass.config.path(f"{DOMAIN}.{time.strftime('%Y%m%d-%H%M%S')}.prof")
+        try:
+            profile = profiler.start_capture()
+        except HomeVentilationControlException as ex:
+            raise ServiceValidationError(str(ex)) from ex
+        try:
+            await asyncio.sleep(capture.total_seconds())
+        finally:
+            # Stop on the event loop, which runs the packet path; only write the file in the executor.
+            profiler.stop_capture(profile)
+        await hass.async_add_executor_job(profile.dump_stats, path)
+        _LOGGER.info("Wrote the profile of the packet path to %s", path)
+        return {"path": path} if call.return_response else None
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_PROFILE,
+        _async_profile,
+        schema = vol.Schema({
+            vol.Optional(ATTR_ENABLED): cv.boolean,
+            vol.Optional(ATTR_CAPTURE): cv.positive_time_period,
+        }),
+        supports_response = SupportsResponse.OPTIONAL,
+    )
+
+    async def _async_set_fans(call: ServiceCall) -> ServiceResponse:
+        """Set the curve of a fan on many devices at once."""
+        if (curve := call.data.get(ATTR_POINTS)) is None:
+            curve = HomeVentilationControlFanCurve.from_adjustment(call.data[ATTR_VALUE])
+        fan = call.data[ATTR_FAN]
+        if (duration := call.data.get(ATTR_DURATION)) is not None:
+            duration = duration.total_seconds()
+        devices = async_get_target_devices(hass, call.data)
+        # The request and its confirmation are built once for all devices.
+        # Without renewals, the devices drop the curve when the duration ends.
+        request = {f"wifi_{fan}": curve.encode(), f"wifi_{fan}_ttl": curve.ttl(duration)}
+        for device in devices:
+            device.release(fan)
+        results = await (await async_get_hub(hass)).send_and_confirm_all(devices, request)
+        response = {}
+        for device in devices:
+            result = results[device.unique_id]
+            if isinstance(result, HomeVentilationControlException):
+                response[device.unique_id] = {"name": device.name, "success": False, "error": str(result)}
+                continue
+            if call.data[ATTR_HOLD] or duration is not None:
+                device.hold(fan, curve.encode(), curve.ttl(), duration)
+            response[device.unique_id] = {"name": device.name, "success": True, "latency": result}
+        if failed := [r["name"] for r in response.values() if not r["success"]]:
+            _LOGGER.warning("%d of %d devices did not apply the curve: %s", len(failed), len(devices), ", ".join(failed))
+        return {"devices": response} if call.return_response else None
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_SET_FANS,
+        _async_set_fans,
+        schema = vol.All(
+            vol.Schema({
+                vol.Optional(ATTR_ENTITY_ID, default = []): cv.comp_entity_ids,
+                vol.Optional(ATTR_DEVICE_ID, default = []): vol.All(cv.ensure_list, [cv.string]),
+                vol.Optional(ATTR_AREA_ID, default = []): vol.All(cv.ensure_list, [cv.string]),
+                vol.Optional(ATTR_LABEL_ID, default = []): vol.All(cv.ensure_list, [cv.string]),
+                vol.Optional(ATTR_FLOOR_ID, default = []): vol.All(cv.ensure_list, [cv.string]),
+                vol.Optional(ATTR_FAN, default = "0"): vol.All(vol.Coerce(str), vol.In(["0", "1"])),
+                vol.Exclusive(ATTR_VALUE, "level"): vol.All(vol.Coerce(float), vol.Range(min = -100, max = 100)),
+                vol.Exclusive(ATTR_POINTS, "level"): HomeVentilationControlFanCurve,
+                vol.Optional(ATTR_HOLD, default = False): cv.boolean,
+                vol.Optional(ATTR_DURATION): cv.positive_time_period,
+            }),
+            cv.has_at_least_one_key(ATTR_VALUE, ATTR_POINTS),
+        ),
+        supports_response = SupportsResponse.OPTIONAL,
+    )
     return True
 
 
+@callback
+def async_get_target_devices(hass: HomeAssistant, data: dict[str, Any]) -> list[HomeVentilationControlDevice]:
+    """Get the loaded devices selected by entity, device, area, floor or label ids, or all if none are given."""
+    devices = [info.device for info in hass.data.get(DOMAIN, {}).values()]
+    device_ids, area_ids, label_ids, floor_ids = (set(data.get(key, ())) for key in (ATTR_DEVICE_ID, ATTR_AREA_ID, ATTR_LABEL_ID, ATTR_FLOOR_ID))
+    # cv.comp_entity_ids also allows "all" and "none" instead of a list.
+    if (entity_ids := data.get(ATTR_ENTITY_ID, [])) == ENTITY_MATCH_ALL:
+        return devices
+    entity_registry = er.async_get(hass)
+    for entity_id in entity_ids if entity_ids != ENTITY_MATCH_NONE else ():
+        if (entity_entry := entity_registry.async_get(entity_id)) and entity_entry.device_id:
+            device_ids.add(entity_entry.device_id)
+    if not (device_ids or area_ids or label_ids or floor_ids or entity_ids):
+        return devices
+    if floor_ids:
+        # Floors exist since Home Assistant 2024.4; a floor selects the devices of its areas.
+        area_ids.update(area.id for area in ar.async_get(hass).async_list_areas() if getattr(area, "floor_id", None) in floor_ids)
+    registry = dr.async_get(hass)
+    selected = []
+    for device in devices:
+        registry_entry = registry.async_get_device(identifiers = {(DOMAIN, device.unique_id)})
+        # Labels exist since Home Assistant 2024.4.
+        if registry_entry and (registry_entry.id in device_ids or registry_entry.area_id in area_ids or not label_ids.isdisjoint(getattr(registry_entry, "labels", ()))):
+            selected.append(device)
+    return selected
+
+
+@callback
+def async_enable_profiler(hass: HomeAssistant, enabled: bool) -> None:
+    """Start or stop timing the packet path of the hub."""
+    hub = hass.data[DATA_HUB]
+    if not enabled:
+        hub.profiler = None
+    elif hub.profiler is None:
+        hub.profiler = HomeVentilationControlProfiler()
+
+
+@callback
+def async_get_device(hass: HomeAssistant, device_id: str) -> HomeVentilationControlDevice:
+    """Get the loaded HomeVentilationControl device of a device registry id."""
+    if registry_entry := dr.async_get(hass).async_get(device_id):
+        for entry_id in registry_entry.config_entries:
+            if info := hass.data.get(DOMAIN, {}).get(entry_id):
+                return info.device
+    raise HomeAssistantError(f"{device_id} is not a loaded Home Ventilation Control device")
+
+
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Set up HomeVentilationControl from a config entry."""
+    peer = (entry.data[CONF_HOST], entry.data[CONF_PORT])
+    cache = await async_get_cache(hass)
     try:
-        devices = await HomeVentilationControlDevice.discover(discovery_address = (entry.data[CONF_HOST], entry.data[CONF_PORT]), unique_id = entry.unique_id)
-        device = list(devices.values())[0]
+        hub = await async_get_hub(hass)
+        # Start from the cached snapshot if there is one; the device is
+        # marked stale until it answers.
+        if (device := cache.create_device(entry.unique_id, peer, hub)) is None:
+            devices = await hub.discover(discovery_address = peer, unique_id = entry.unique_id)
+            device = list(devices.values())[0]
     except HomeVentilationControlException as ex:
         raise ConfigEntryNotReady from ex
 
-    async def _async_update() -> None:
-        """Update the HomeVentilationControl device."""
-        device.keep_alive()
-        device.recv()
+    def _no_response() -> UpdateFailed:
+        return UpdateFailed("No response from device {0} ({1}:{2})".format(device.name, entry.data[CONF_HOST], entry.data[CONF_PORT]))
+
+    async def _async_update() -> dict[str, Any]:
+        """Ask the HomeVentilationControl device for fresh data."""
         if device.timeout():
-            raise UpdateFailed("No response from device {0} ({1}:{2})".format(device.name, entry.data[CONF_HOST], entry.data[CONF_PORT]))
+            raise _no_response()
+        device.force_update()
+        return device.record
 
     coordinator = DataUpdateCoordinator(
         hass = hass,
         logger = _LOGGER,
         name = device.unique_id,
-        # The library only sends keepalives with its internal frequency.
-        # These "updates" are for receiving push data. FIXME: Should use asyncio push.
-        update_interval = timedelta(seconds = 10),
+        # No update_interval: the device pushes its data and the library
+        # sends keepalives with its internal frequency.
         update_method = _async_update,
         request_refresh_debouncer = Debouncer(
             hass, _LOGGER, cooldown = 1, immediate = False
         ),
     )
-    hass.data.setdefault(DOMAIN, {})[entry.entry_id] = InstanceInfo(device, coordinator)
+
+    boost = None
+    if entry.options.get(CONF_HUMIDITY_BOOST):
+        boost = HomeVentilationControlHumidityBoost(
+            device,
+            fan = entry.options.get(CONF_BOOST_FAN, DEFAULT_BOOST_FAN),
+            setpoint = entry.options.get(CONF_HUMIDITY_SETPOINT, DEFAULT_HUMIDITY_SETPOINT),
+            hysteresis = entry.options.get(CONF_HUMIDITY_HYSTERESIS, DEFAULT_HUMIDITY_HYSTERESIS),
+            boost = entry.options.get(CONF_BOOST_LEVEL, DEFAULT_BOOST_LEVEL),
+        )
+
+    @callback
+    def _async_device_updated(device: HomeVentilationControlDevice) -> None:
+        """Publish pushed data (or a timeout) from the device."""
+        if device.timeout():
+            coordinator.async_set_update_error(_no_response())
+        else:
+            if boost:
+                # React to the packet itself, before any state is written.
+                boost.update()
+            cache.async_update(device)
+            coordinator.async_set_updated_data(device.record)
+
+    if entry.options.get(CONF_PROFILING):
+        async_enable_profiler(hass, True)
+    device.set_layout(DATA_LAYOUT)
+    await device.start(_async_device_updated)
+    coordinator.async_set_updated_data(device.record)
+
+    if device.stale:
+        async def _async_reconnect() -> None:
+            """Find a cached device whose address may have changed."""
+            try:
+                # Replies reach the started device through the hub.
+                await hub.discover(discovery_address = peer, unique_id = entry.unique_id)
+            except HomeVentilationControlException as ex:
+                _LOGGER.debug("Device %s did not answer yet: %s", entry.unique_id, ex)
+
+        entry.async_on_unload(hass.async_create_task(_async_reconnect()).cancel)
+    entry.async_on_unload(entry.add_update_listener(_async_options_updated))
+    hass.data.setdefault(DOMAIN, {})[entry.entry_id] = InstanceInfo(device, coordinator, boost)
     await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
 
+    # Ask the device for only what the enabled entities read. Enabling an
+    # entity reloads the entry, which subscribes again.
+    keys = [
+        registry_entry.unique_id.split(":", 1)[1]
+        for registry_entry in er.async_entries_for_config_entry(er.async_get(hass), entry.entry_id)
+        if not registry_entry.disabled_by
+    ]
+    paths = subscribed_paths(keys) + (["air.rh"] if boost else [])
+    device.subscribe(paths)
+    # Paths which are not subscribed to would only have NaN in the history.
+    device.history = HomeVentilationControlHistory([path for path in HISTORY_PATHS if path in paths])
+
     return True
 
 
@@ -120,11 +458,27 @@ async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     entry_info = hass.data[DOMAIN][entry.entry_id]
     if unload_ok := await hass.config_entries.async_unload_platforms(entry, PLATFORMS):
         hass.data[DOMAIN].pop(entry.entry_id)
+    if entry_info.boost:
+        entry_info.boost.stop()
     entry_info.device.close()
+    (await async_get_cache(hass)).async_release(entry_info.device)
     return unload_ok
 
+
+async def _async_options_updated(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Apply changed options by reloading the entry."""
+    if not any(other.options.get(CONF_PROFILING) for other in hass.config_entries.async_entries(DOMAIN)):
+        async_enable_profiler(hass, False)
+    await hass.config_entries.async_reload(entry.entry_id)
+
+
+async def async_remove_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Forget the cached data of a removed device."""
+    (await async_get_cache(hass)).async_remove(entry.unique_id)
+
 @dataclass
 class InstanceInfo:
     device: HomeVentilationControlDevice
     coordinator: DataUpdateCoordinator
+    boost: HomeVentilationControlHumidityBoost | None = None
     #root_device_info: Any
@@ -2,7 +2,7 @@
 from __future__ import annotations
 
 from .lib import *
-from .entity import HomeVentilationControlEntity, async_setup_entry_with_type
+from .entity import HomeVentilationControlEntity, async_setup_entry_with_type, BINARY_SENSOR_DESCRIPTIONS
 
 from homeassistant.components.binary_sensor import BinarySensorEntity
 from homeassistant.config_entries import ConfigEntry
@@ -16,7 +16,7 @@ async def async_setup_entry(
     async_add_entities: AddEntitiesCallback,
 ) -> None:
     """Set up binary sensors."""
-    await async_setup_entry_with_type(hass, config_entry, async_add_entities, HomeVentilationControlBinarySensor)
+    await async_setup_entry_with_type(hass, config_entry, async_add_entities, HomeVentilationControlBinarySensor, BINARY_SENSOR_DESCRIPTIONS)
 
 
 class HomeVentilationControlBinarySensor(HomeVentilationControlEntity, BinarySensorEntity):
@@ -0,0 +1,91 @@
+"""Cache of HomeVentilationControl device data across restarts."""
+from __future__ import annotations
+
+import asyncio
+from typing import Any
+
+from .lib import *
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.storage import Store
+
+from .const import DOMAIN, DATA_CACHE
+
+STORAGE_VERSION = 1
+STORAGE_KEY = f"{DOMAIN}.cache"
+# Seconds between writes; pushes in between only replace the snapshot in memory.
+SAVE_DELAY = 300
+
+
+async def async_get_cache(hass: HomeAssistant) -> HomeVentilationControlCache:
+    """Get the loaded device cache."""
+    if (cache := hass.data.get(DATA_CACHE)) is None:
+        cache = hass.data[DATA_CACHE] = HomeVentilationControlCache(hass)
+    await cache.async_load()
+    return cache
+
+
+class HomeVentilationControlCache:
+    """The latest data and address of each device, persisted in a Store.
+
+    Devices can be created from the cache at startup without waiting for
+    them to answer; such devices are marked stale until their first packet.
+    """
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        self._store = Store(hass, STORAGE_VERSION, STORAGE_KEY)
+        self._cached: dict[str, dict[str, Any]] = {}
+        self._devices: dict[str, HomeVentilationControlDevice] = {}
+        self._save_pending = False
+        self._loaded = None
+
+    async def async_load(self) -> None:
+        """Load the cache; safe to call (and await) many times."""
+        if self._loaded is None:
+            self._loaded = asyncio.ensure_future(self._async_load())
+        await asyncio.shield(self._loaded)
+
+    async def _async_load(self) -> None:
+        self._cached = await self._store.async_load() or {}
+
+    def create_device(self, unique_id: str, peer, hub: HomeVentilationControlHub) -> HomeVentilationControlDevice | None:
+        """Create a stale device from the cached snapshot, if there is one."""
+        if (cached := self._cached.get(unique_id)) is None:
+            return None
+        device = HomeVentilationControlDevice(cached["data"], peer, hub, tuple(cached["address"]))
+        device.stale = True
+        return device
+
+    @callback
+    def async_update(self, device: HomeVentilationControlDevice) -> None:
+        """Remember the device's current data; it is written after SAVE_DELAY."""
+        self._devices[device.unique_id] = device
+        if not self._save_pending:
+            self._save_pending = True
+            self._store.async_delay_save(self._data_to_save, SAVE_DELAY)
+
+    @callback
+    def async_release(self, device: HomeVentilationControlDevice) -> None:
+        """Stop following a closed device, keeping its latest snapshot."""
+        self._snapshot(device)
+        if self._devices.get(device.unique_id) is device:
+            del self._devices[device.unique_id]
+
+    @callback
+    def async_remove(self, unique_id: str) -> None:
+        """Forget a device."""
+        self._devices.pop(unique_id, None)
+        if self._cached.pop(unique_id, None) is not None:
+            self._save_pending = True
+            self._store.async_delay_save(self._data_to_save, 0)
+
+    def _snapshot(self, device: HomeVentilationControlDevice) -> None:
+        if not device.stale:
+            self._cached[device.unique_id] = {"data": device.data, "address": list(device.address)}
+
+    @callback
+    def _data_to_save(self) -> dict[str, dict[str, Any]]:
+        self._save_pending = False
+        for device in self._devices.values():
+            self._snapshot(device)
+        return self._cached
@@ -7,12 +7,26 @@ from .lib import *
 import voluptuous as vol
 
 from homeassistant import config_entries
+from homeassistant.components import onboarding
 from homeassistant.const import CONF_DEVICE, CONF_UNIQUE_ID, CONF_HOST, CONF_PORT # TODO: CONF_CLIENT_SECRET
 from homeassistant.core import callback
-from homeassistant.data_entry_flow import FlowResult
-
-from . import async_discover_devices
-from .const import DOMAIN
+from homeassistant.data_entry_flow import AbortFlow, FlowResult
+from homeassistant.helpers.typing import DiscoveryInfoType
+
+from . import async_iter_discovered_devices, async_get_hub
+from .const import (
+    DOMAIN,
+    CONF_HUMIDITY_BOOST,
+    CONF_HUMIDITY_SETPOINT,
+    CONF_HUMIDITY_HYSTERESIS,
+    CONF_BOOST_FAN,
+    CONF_BOOST_LEVEL,
+    CONF_PROFILING,
+    DEFAULT_HUMIDITY_SETPOINT,
+    DEFAULT_HUMIDITY_HYSTERESIS,
+    DEFAULT_BOOST_FAN,
+    DEFAULT_BOOST_LEVEL,
+)
 
 
 class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
@@ -20,6 +34,12 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
 
     VERSION = 1
 
+    @staticmethod
+    @callback
+    def async_get_options_flow(config_entry: config_entries.ConfigEntry) -> HomeVentilationControlOptionsFlow:
+        """Get the options flow for this handler."""
+        return HomeVentilationControlOptionsFlow(config_entry)
+
     def __init__(self) -> None:
         """Initialize the config flow."""
         self._discovered_devices = {}
@@ -108,10 +128,14 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             if not (port := user_input[CONF_PORT]):
                 port = HomeVentilationControlDevice.DEFAULT_PORT
             if not (host := user_input[CONF_HOST]):
-                self._discovered_devices = await async_discover_devices(self.hass, port)
+                self._discovered_devices = {
+                    device.unique_id: device
+                    async for device in async_iter_discovered_devices(self.hass, port)
+                }
                 return await self.async_step_pick_device()
             try:
-                self._discovered_devices = await HomeVentilationControlDevice.discover(discovery_address = (host, port))
+                hub = await async_get_hub(self.hass)
+                self._discovered_devices = await hub.discover(discovery_address = (host, port))
                 return await self.async_step_pick_device()
             except HomeVentilationControlException:
                 errors["base"] = "cannot_connect"
@@ -124,3 +148,31 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             }),
             errors=errors,
         )
+
+
+class HomeVentilationControlOptionsFlow(config_entries.OptionsFlow):
+    """Handle options of a HomeVentilationControl device."""
+
+    def __init__(self, config_entry: config_entries.ConfigEntry) -> None:
+        """Initialize the options flow."""
+        self.config_entry = config_entry
+
+    async def async_step_init(
+        self, user_input: dict[str, Any] | None = None
+    ) -> FlowResult:
+        """Configure the humidity boost and profiling."""
+        if user_input is not None:
+            return self.async_create_entry(title="", data=user_input)
+
+        options = self.config_entry.options
+        return self.async_show_form(
+            step_id="init",
+            data_schema=vol.Schema({
+                vol.Required(CONF_HUMIDITY_BOOST, default=options.get(CONF_HUMIDITY_BOOST, False)): bool,
+                vol.Required(CONF_HUMIDITY_SETPOINT, default=options.get(CONF_HUMIDITY_SETPOINT, DEFAULT_HUMIDITY_SETPOINT)): vol.All(vol.Coerce(float), vol.Range(min=0, max=100)),
+                vol.Required(CONF_HUMIDITY_HYSTERESIS, default=options.get(CONF_HUMIDITY_HYSTERESIS, DEFAULT_HUMIDITY_HYSTERESIS)): vol.All(vol.Coerce(float), vol.Range(min=0, max=50)),
+                vol.Required(CONF_BOOST_FAN, default=options.get(CONF_BOOST_FAN, DEFAULT_BOOST_FAN)): vol.In({"0": "main fan", "1": "kitchen hood"}),
+                vol.Required(CONF_BOOST_LEVEL, default=options.get(CONF_BOOST_LEVEL, DEFAULT_BOOST_LEVEL)): vol.All(vol.Coerce(int), vol.Range(min=0, max=100)),
+                vol.Required(CONF_PROFILING, default=options.get(CONF_PROFILING, False)): bool,
+            }),
+        )
@@ -1,3 +1,29 @@
 """Const for HomeVentilationControl."""
 
 DOMAIN = "home_ventilation_control"
+
+DATA_HUB = f"{DOMAIN}_hub"
+DATA_CACHE = f"{DOMAIN}_cache"
+DATA_DISCOVERY = f"{DOMAIN}_discovery"
+
+# Options of the humidity boost controller.
+CONF_HUMIDITY_BOOST = "humidity_boost"
+CONF_HUMIDITY_SETPOINT = "humidity_setpoint"
+CONF_HUMIDITY_HYSTERESIS = "humidity_hysteresis"
+CONF_BOOST_FAN = "boost_fan"
+CONF_BOOST_LEVEL = "boost_level"
+
+# Option to time the packet path; see HomeVentilationControlProfiler.
+CONF_PROFILING = "profiling"
+
+DEFAULT_HUMIDITY_SETPOINT = 65
+DEFAULT_HUMIDITY_HYSTERESIS = 5
+DEFAULT_BOOST_FAN = "0"
+DEFAULT_BOOST_LEVEL = 50
+
+# Service fields.
+ATTR_VALUE = "value"
+ATTR_POINTS = "points"
+ATTR_FAN = "fan"
+ATTR_HOLD = "hold"
+ATTR_DURATION = "duration"
@@ -0,0 +1,33 @@
+"""Diagnostics support for HomeVentilationControl."""
+from __future__ import annotations
+
+from typing import Any
+
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import CONF_HOST
+from homeassistant.core import HomeAssistant
+
+from .const import DOMAIN
+
+TO_REDACT = {CONF_HOST}
+
+
+async def async_get_config_entry_diagnostics(hass: HomeAssistant, entry: ConfigEntry) -> dict[str, Any]:
+    """Return diagnostics of a config entry, with the short-term history of its device."""
+    device = hass.data[DOMAIN][entry.entry_id].device
+    return {
+        "entry": async_redact_data(entry.as_dict(), TO_REDACT),
+        "device": {
+            "stale": device.stale,
+            "timeout": device.timeout(),
+            "keepalive_interval": device.keepalive_interval(),
+            "update_timeout": device.update_timeout(),
+            "command_latency": device.command_latency,
+            "holds": {fan: {"ttl": ttl, "points": points, "until": until} for fan, (ttl, points, until) in device.holds.items()},
+        },
+        "stats": device.stats.as_dict(),
+        "data": device.data,
+        "history": device.history.samples() if device.history else None,
+        "profiler": device.hub.profiler.as_dict() if device.hub.profiler else None,
+    }
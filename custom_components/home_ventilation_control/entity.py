@@ -1,15 +1,17 @@
 """Base class for HomeVentilationControl entity."""
 from __future__ import annotations
 
+from collections.abc import Callable
+from functools import partial
+from typing import Any, NamedTuple
+
 from .lib import *
 
 from homeassistant.components.binary_sensor import (
-    BinarySensorEntity,
     BinarySensorDeviceClass,
     BinarySensorEntityDescription,
 )
 from homeassistant.components.sensor import (
-    SensorEntity,
     SensorDeviceClass,
     SensorEntityDescription,
     SensorStateClass,
@@ -19,11 +21,12 @@ from homeassistant.const import (
     REVOLUTIONS_PER_MINUTE,
     UnitOfTemperature,
     UnitOfElectricPotential,
+    UnitOfInformation,
     UnitOfTime,
 )
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.core import HomeAssistant
-from homeassistant.helpers.entity import DeviceInfo
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.entity import DeviceInfo, EntityCategory, EntityDescription
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.helpers.update_coordinator import DataUpdateCoordinator, CoordinatorEntity
 
@@ -35,74 +38,146 @@ def make_device_info(device):
         name = device.name or f"Home Ventilation Control {device.unique_id}",
     )
 
-async def async_setup_entry_with_type(
-    hass: HomeAssistant,
-    config_entry: ConfigEntry,
-    async_add_entities: AddEntitiesCallback,
-    cls,
-) -> None:
-    entities = []
+class HomeVentilationControlEntityDescription(NamedTuple):
+    """An entity description with the functions reading its value, shared by all devices."""
 
-    info = hass.data[DOMAIN][config_entry.entry_id]
-    device = info.device
+    description: EntityDescription
+    value_getter: Callable[[HomeVentilationControlDevice], Any]
+    value_filter: Callable[[Any], Any] | None = None
+    attributes_getter: Callable[[HomeVentilationControlDevice], dict[str, Any]] | None = None
+    # Path of the unit of measurement in the device data.
+    unit_path: str | None = None
+    # Whether the value is read from device.data at description.key, so that
+    # state writes can be skipped when the key hasn't changed.
+    from_data: bool = True
+    # Factory of a per-entity aggregator (HomeVentilationControlWindow or
+    # HomeVentilationControlDeadband) which decides which samples to publish.
+    aggregate: Callable[[], Any] | None = None
 
-    device_info = make_device_info(device)
+def _data_getter(path):
+    return lambda device: device.get(path)
 
-    def add_entity(*args):
-        entities.append(cls(device, info.coordinator, *args, device_info))
+def _per_ten(x):
+    return x / 10
+
+def _per_thousand(x):
+    return x / 1_000
+
+def _seconds(x):
+    return round(x, 1)
+
+def _milliseconds(x):
+    return round(x * 1_000, 1)
+
+def _build_descriptions():
+    """Build the description registry once; returns (sensors, binary sensors)."""
+    sensors = []
+    binary_sensors = []
 
     def DescCommon(kwargs, enabled, key, name):
         kwargs["key"] = key
         kwargs["name"] = name
-        kwargs["entity_registry_enabled_default"] = enabled
+        kwargs["entity_registry_enabled_default"] = bool(enabled)
 
     def DescBinarySensor(enabled, key, name, value_getter = None, **kwargs):
         DescCommon(kwargs, enabled, key, name)
-        if issubclass(cls, BinarySensorEntity):
-            add_entity(BinarySensorEntityDescription(**kwargs), bool, value_getter)
+        binary_sensors.append(HomeVentilationControlEntityDescription(
+            BinarySensorEntityDescription(**kwargs), value_getter or _data_getter(key), bool,
+            from_data = value_getter is None,
+        ))
 
-    def DescSensor(enabled, key, name, device_class = None, native_unit_of_measurement = None, state_class = SensorStateClass.MEASUREMENT, value_filter = None, value_getter = None, **kwargs):
+    def DescSensor(enabled, key, name, device_class = None, native_unit_of_measurement = None, state_class = SensorStateClass.MEASUREMENT, value_filter = None, value_getter = None, attributes_getter = None, unit_path = None, aggregate = None, **kwargs):
         DescCommon(kwargs, enabled, key, name)
         kwargs["device_class"] = device_class
         kwargs["native_unit_of_measurement"] = native_unit_of_measurement
         kwargs["state_class"] = state_class
-        if issubclass(cls, SensorEntity):
-            add_entity(SensorEntityDescription(**kwargs), value_filter, value_getter)
+        sensors.append(HomeVentilationControlEntityDescription(
+            SensorEntityDescription(**kwargs), value_getter or _data_getter(key), value_filter, attributes_getter, unit_path,
+            from_data = value_getter is None, aggregate = aggregate,
+        ))
 
-    DescSensor(0, "uptime", "Uptime", SensorDeviceClass.DURATION, UnitOfTime.SECONDS, SensorStateClass.TOTAL_INCREASING, value_filter = lambda x: x and x/1_000)
+    # Noisy measurements are published as 5-minute means or on bigger changes only.
+    window = partial(HomeVentilationControlWindow, 300)
+    deadband = partial(HomeVentilationControlDeadband, 2)
+    deadband_mv = partial(HomeVentilationControlDeadband, 50)
 
-    DescSensor(1, "air.rh", "relative humidity", SensorDeviceClass.HUMIDITY, PERCENTAGE, value_filter = lambda x: x and x/10)
-    DescSensor(1, "air.temperature", "temperature", SensorDeviceClass.TEMPERATURE, UnitOfTemperature.CELSIUS, value_filter = lambda x: x and x/10)
+    DescSensor(0, "uptime", "Uptime", SensorDeviceClass.DURATION, UnitOfTime.SECONDS, SensorStateClass.TOTAL_INCREASING, value_filter = _per_thousand)
+
+    DescSensor(1, "air.rh", "relative humidity", SensorDeviceClass.HUMIDITY, PERCENTAGE, value_filter = _per_ten)
+    DescSensor(1, "air.temperature", "temperature", SensorDeviceClass.TEMPERATURE, UnitOfTemperature.CELSIUS, value_filter = _per_ten)
 
     DescBinarySensor(0, "0.on", "main fan switch")
     DescBinarySensor(0, "0.own", "main custom control switch")
     DescSensor(1, "0.target", "main fan speed", None, PERCENTAGE, icon = "mdi:fan")
     DescSensor(0, "0.target_no_wifi", "main fan target speed before Wi-Fi adjustment", None, PERCENTAGE, icon = "mdi:fan")
-    DescSensor(1, "0.percentage", "main fan measured speed", None, PERCENTAGE, icon = "mdi:fan")
-    DescSensor(0, "0.rpm", "main fan RPM", None, REVOLUTIONS_PER_MINUTE, icon = "mdi:fan")
-    DescSensor(1, "0.controller.level", "main controller level", None, device.get("0.controller.unit"), icon = "mdi:speedometer")
+    DescSensor(1, "0.percentage", "main fan measured speed", None, PERCENTAGE, aggregate = deadband, icon = "mdi:fan")
+    DescSensor(0, "0.rpm", "main fan RPM", None, REVOLUTIONS_PER_MINUTE, aggregate = window, icon = "mdi:fan")
+    DescSensor(1, "0.controller.level", "main controller level", None, None, unit_path = "0.controller.unit", icon = "mdi:speedometer")
     DescSensor(0, "0.ir.speed", "main IR level", None, None, icon = "mdi:speedometer")
     DescBinarySensor(1, "0.wifi.valid", "main fan Wi-Fi settings active", icon = "mdi:wifi")
 
-    DescSensor(0, "0.controller.measured_level", "main controller measured level", None, device.get("0.controller.unit"))
-    DescSensor(0, "0.controller.millivolts", "main controller voltage", SensorDeviceClass.VOLTAGE, UnitOfElectricPotential.MILLIVOLT)
+    DescSensor(0, "0.controller.measured_level", "main controller measured level", None, None, unit_path = "0.controller.unit")
+    DescSensor(0, "0.controller.millivolts", "main controller voltage", SensorDeviceClass.VOLTAGE, UnitOfElectricPotential.MILLIVOLT, aggregate = deadband_mv)
 
     DescBinarySensor(0, "1.on", "kitchen hood fan switch")
     DescBinarySensor(0, "1.own", "kitchen hood custom control switch")
     DescSensor(1, "1.target", "kitchen hood fan speed", None, PERCENTAGE, icon = "mdi:fan")
     DescSensor(0, "1.target_no_wifi", "kitchen hood fan target speed before Wi-Fi adjustment", None, PERCENTAGE, icon = "mdi:fan")
-    DescSensor(1, "1.percentage", "kitchen hood fan measured speed", None, PERCENTAGE, icon = "mdi:fan")
-    DescSensor(0, "1.rpm", "kitchen hood fan RPM", None, REVOLUTIONS_PER_MINUTE, icon = "mdi:fan")
-    DescSensor(1, "1.controller.level", "kitchen hood controller level", None, device.get("1.controller.unit"), icon = "mdi:speedometer")
+    DescSensor(1, "1.percentage", "kitchen hood fan measured speed", None, PERCENTAGE, aggregate = deadband, icon = "mdi:fan")
+    DescSensor(0, "1.rpm", "kitchen hood fan RPM", None, REVOLUTIONS_PER_MINUTE, aggregate = window, icon = "mdi:fan")
+    DescSensor(1, "1.controller.level", "kitchen hood controller level", None, None, unit_path = "1.controller.unit", icon = "mdi:speedometer")
     DescSensor(1, "1.ir.speed", "kitchen hood IR level", None, None, icon = "mdi:speedometer")
     DescBinarySensor(1, "1.wifi.valid", "kitchen hood fan Wi-Fi settings active", icon = "mdi:wifi")
 
-    DescSensor(0, "1.controller.measured_level", "kitchen hood controller measured level", None, device.get("1.controller.unit"))
-    DescSensor(0, "1.controller.millivolts", "kitchen hood controller voltage", SensorDeviceClass.VOLTAGE, UnitOfElectricPotential.MILLIVOLT)
+    DescSensor(0, "1.controller.measured_level", "kitchen hood controller measured level", None, None, unit_path = "1.controller.unit")
+    DescSensor(0, "1.controller.millivolts", "kitchen hood controller voltage", SensorDeviceClass.VOLTAGE, UnitOfElectricPotential.MILLIVOLT, aggregate = deadband_mv)
 
     DescBinarySensor(1, "1.ir.light", "kitchen hood IR light", icon = "mdi:lightbulb-fluorescent-tube")
 
-    async_add_entities(entities)
+    diagnostic = {"entity_category": EntityCategory.DIAGNOSTIC}
+    DescSensor(0, "stats.packets", "packets received", None, None, SensorStateClass.TOTAL_INCREASING, value_getter = lambda device: device.stats.packets, icon = "mdi:download-network", **diagnostic)
+    DescSensor(0, "stats.bytes", "data received", SensorDeviceClass.DATA_SIZE, UnitOfInformation.BYTES, SensorStateClass.TOTAL_INCREASING, value_getter = lambda device: device.stats.bytes, **diagnostic)
+    DescSensor(0, "stats.dropped.invalid", "invalid packets dropped", None, None, SensorStateClass.TOTAL_INCREASING, value_getter = lambda device: device.stats.dropped["invalid"], icon = "mdi:package-variant-remove", **diagnostic)
+    DescSensor(0, "stats.dropped.unique_id", "foreign packets dropped", None, None, SensorStateClass.TOTAL_INCREASING, value_getter = lambda device: device.stats.dropped["unique_id"], icon = "mdi:package-variant-remove", **diagnostic)
+    DescSensor(0, "stats.interval", "packet interval", SensorDeviceClass.DURATION, UnitOfTime.SECONDS, value_getter = lambda device: device.stats.interval, value_filter = _seconds, attributes_getter = lambda device: device.stats.histogram(), **diagnostic)
+    DescSensor(0, "stats.rtt", "round-trip time", SensorDeviceClass.DURATION, UnitOfTime.MILLISECONDS, value_getter = lambda device: device.stats.rtt, value_filter = _milliseconds, **diagnostic)
+    DescSensor(0, "command_latency", "command latency", SensorDeviceClass.DURATION, UnitOfTime.MILLISECONDS, value_getter = lambda device: device.command_latency, value_filter = _milliseconds, **diagnostic)
+
+    return tuple(sensors), tuple(binary_sensors)
+
+SENSOR_DESCRIPTIONS, BINARY_SENSOR_DESCRIPTIONS = _build_descriptions()
+
+# The paths which the integration reads whichever entities are enabled:
+# the name, and what the fan adjustment numbers and holds need.
+BASE_PATHS = ["conf.name"] + [f"{fan}.{key}" for fan in ("0", "1") for key in ("target_no_wifi", "wifi.valid", "wifi.points", "wifi.ttl")]
+
+# The paths read by the entity of each description key.
+_ENTITY_PATHS = {
+    d.description.key: [d.description.key] + ([d.unit_path] if d.unit_path else [])
+    for d in SENSOR_DESCRIPTIONS + BINARY_SENSOR_DESCRIPTIONS
+    if d.from_data
+}
+
+# The paths of device data which the integration reads; devices keep only these.
+DATA_LAYOUT = HomeVentilationControlLayout(BASE_PATHS + [path for paths in _ENTITY_PATHS.values() for path in paths])
+
+def subscribed_paths(keys) -> list[str]:
+    """The paths needed when the entities of the description keys are enabled."""
+    return BASE_PATHS + [path for key in keys for path in _ENTITY_PATHS.get(key, ())]
+
+# The numeric paths kept in the short-term history of each device.
+HISTORY_PATHS = [d.description.key for d in SENSOR_DESCRIPTIONS + BINARY_SENSOR_DESCRIPTIONS if d.from_data]
+
+async def async_setup_entry_with_type(
+    hass: HomeAssistant,
+    config_entry: ConfigEntry,
+    async_add_entities: AddEntitiesCallback,
+    cls,
+    descriptions: tuple[HomeVentilationControlEntityDescription, ...],
+) -> None:
+    info = hass.data[DOMAIN][config_entry.entry_id]
+    device_info = make_device_info(info.device)
+    async_add_entities([cls(info.device, info.coordinator, description, device_info) for description in descriptions])
 
 class HomeVentilationControlEntity(CoordinatorEntity):
     """Representation of a HomeVentilationControl sensor."""
@@ -113,24 +188,56 @@ class HomeVentilationControlEntity(CoordinatorEntity):
         self,
         device: HomeVentilationControlDevice,
         coordinator: DataUpdateCoordinator,
-        description,
-        value_filter,
-        value_getter,
+        description: HomeVentilationControlEntityDescription,
         device_info: DeviceInfo,
     ) -> None:
         super().__init__(coordinator)
         self._device = device
-        self._value_filter = value_filter or (lambda x: x)
-        self._value_getter = value_getter or (lambda: self._device.get(self.entity_description.key))
-        self.entity_description = description
-        self._attr_name = description.name
-        self._attr_unique_id = device.unique_id + ":" + description.key
+        self._description = description
+        self.entity_description = description.description
+        self._attr_name = description.description.name
+        self._attr_unique_id = device.unique_id + ":" + description.description.key
         self._attr_device_info = device_info
+        if description.unit_path:
+            self._attr_native_unit_of_measurement = device.get(description.unit_path)
+        self._aggregate = description.aggregate() if description.aggregate else None
+        self._written_available = None
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        """Write state only if the value (or its aggregate) or the availability has changed."""
+        available = self.available
+        if self._aggregate:
+            # Every fresh packet is a sample, changed or not.
+            value = self._get_raw_converted_value() if available and not self._device.stale else None
+            changed = value is not None and self._aggregate.add(value)
+        else:
+            changed = not self._description.from_data or self._device.changed(self.entity_description.key)
+        if available != self._written_available or changed:
+            self._written_available = available
+            if profiler := self._device.hub.profiler:
+                profiler.entity_written()
+            self.async_write_ha_state()
+
+    @property
+    def extra_state_attributes(self):
+        getter = self._description.attributes_getter
+        attributes = getter(self._device) if getter else {}
+        if self._aggregate:
+            attributes = attributes | self._aggregate.attributes
+        if self._device.stale:
+            attributes = attributes | {"stale": True}
+        return attributes or None
 
     def _get_converted_value(self):
-        value = self._value_getter()
+        if self._aggregate and self._aggregate.value is not None:
+            return self._aggregate.value
+        return self._get_raw_converted_value()
+
+    def _get_raw_converted_value(self):
+        value = self._description.value_getter(self._device)
         if value is None:
             return None
-        if self._value_filter:
-            return self._value_filter(value)
+        if value_filter := self._description.value_filter:
+            return value_filter(value)
         return value
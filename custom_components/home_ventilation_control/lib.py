@@ -1,155 +1,1182 @@
 """Library to connect to HomeVentilationControl devices."""
 
 import asyncio
-import socket, errno, json, time
+from array import array
+import bisect, contextlib, cProfile, functools, heapq, itertools, logging, math, socket, json, time, zlib
 from asyncio.exceptions import TimeoutError, CancelledError
+from collections import namedtuple
+
+_LOGGER = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 class HomeVentilationControlException(BaseException):
     pass
 class HomeVentilationControlTimeoutException(HomeVentilationControlException):
     pass
+class HomeVentilationControlSupersededException(HomeVentilationControlException):
+    pass
 
-class HomeVentilationControlDevice:
-    REQUEST_TIMEOUT = 5
-    KEEPALIVE_INTERVAL = 303
-    UPDATE_TIMEOUT = 910
-    DEFAULT_PORT = 38866
+# JSON codec for datagrams: loads(bytes) -> object, dumps(object) -> bytes.
+# Decoding errors must be ValueErrors (both json and orjson comply).
+Codec = namedtuple("Codec", "name loads dumps")
 
-    @staticmethod
-    def _recvfrom(s, unique_id = None):
-        while True:
+STDLIB_CODEC = Codec("json", json.loads, lambda obj: json.dumps(obj, separators = (",", ":")).encode())
+ORJSON_CODEC = orjson and Codec("orjson", orjson.loads, orjson.dumps)
+DEFAULT_CODEC = ORJSON_CODEC or STDLIB_CODEC
+
+@functools.lru_cache(maxsize = None)
+def compile_path(path: str):
+    """Compile a dotted path like "0.controller.level" into a getter for nested data.
+
+    The getter returns None if any component is missing. Compiled getters
+    are cached, so entities and device.get() share them.
+    """
+    keys = tuple(path.split("."))
+    if len(keys) == 1:
+        a, = keys
+        def getter(data):
             try:
-                data, peer = s.recvfrom(2048)
-                data = json.loads(data)["HomeVentilationControl"]
-                if data["unique_id"] == unique_id or unique_id is None:
-                    return data, peer
-            except OSError as ex:
-                if ex.errno == errno.EWOULDBLOCK:
-                    return None, None
-                raise
-            except (json.decoder.JSONDecodeError, KeyError):
-                pass
+                return data[a]
+            except (LookupError, TypeError):
+                return None
+    elif len(keys) == 2:
+        a, b = keys
+        def getter(data):
+            try:
+                return data[a][b]
+            except (LookupError, TypeError):
+                return None
+    elif len(keys) == 3:
+        a, b, c = keys
+        def getter(data):
+            try:
+                return data[a][b][c]
+            except (LookupError, TypeError):
+                return None
+    else:
+        def getter(data):
+            try:
+                for key in keys:
+                    data = data[key]
+                return data
+            except (LookupError, TypeError):
+                return None
+    getter.path = path
+    return getter
 
-    @classmethod
-    async def _async_recvfrom(cls, s, unique_id = None, timeout: float = REQUEST_TIMEOUT):
-        async def _recv():
-            while True:
-                data, peer = cls._recvfrom(s, unique_id)
-                if data:
-                    return data, peer
-                await asyncio.sleep(0.1)
+def diff_paths(old, new, prefix = "", changed = None) -> set[str]:
+    """Return the dotted paths whose values differ between old and new.
+
+    Ancestors of a changed value are included, so "0.wifi" is in the result
+    whenever "0.wifi.points" is. Lists are compared as single values.
+    """
+    if changed is None:
+        changed = set()
+    if old == new:
+        return changed
+    if prefix:
+        changed.add(prefix)
+        prefix += "."
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key in old.keys() | new.keys():
+            diff_paths(old.get(key), new.get(key), prefix + key, changed)
+    return changed
+
+class HomeVentilationControlLayout:
+    """A fixed set of dotted paths which devices keep from each packet.
+
+    A device with a layout stores only a tuple of these values (its record)
+    instead of the whole decoded packet. Layouts are shared by devices.
+    """
+
+    __slots__ = ("paths", "index", "_getters", "_changes")
+
+    def __init__(self, paths):
+        self.paths = tuple(dict.fromkeys(paths))
+        self.index = {path: i for i, path in enumerate(self.paths)}
+        self._getters = tuple(compile_path(path) for path in self.paths)
+        # What diff_paths would report for a change at each path: the path and its ancestors.
+        self._changes = tuple(
+            frozenset(path.rsplit(".", n)[0] for n in range(path.count(".") + 1))
+            for path in self.paths
+        )
+
+    def extract(self, data) -> tuple:
+        return tuple([getter(data) for getter in self._getters])
+
+    def diff(self, old: tuple, new: tuple) -> set[str]:
+        """Like diff_paths() for two records."""
+        changed = set()
+        if old != new:
+            for changes, a, b in zip(self._changes, old, new):
+                if a != b:
+                    changed |= changes
+        return changed
+
+    def to_dict(self, record: tuple) -> dict:
+        """Rebuild nested data from a record, leaving out missing values."""
+        data = {}
+        for path, value in zip(self.paths, record):
+            if value is not None:
+                *parents, key = path.split(".")
+                d = data
+                for parent in parents:
+                    d = d.setdefault(parent, {})
+                d[key] = value
+        return data
+
+class HomeVentilationControlFanCurve:
+    """A piecewise linear curve from the native fan level to the fan speed, as in wifi_N.
+
+    Points are [level, speed] pairs of integer percentages with increasing
+    levels. Below the first and above the last point the curve is flat.
+    """
+
+    # Longest TTLs (ms) for curves which lower or only raise the speed.
+    MAX_LOW_TIME = 3 * 3600_000
+    MAX_HIGH_TIME = 18 * 3600_000
+
+    __slots__ = ("points",)
+
+    def __init__(self, points):
         try:
-            return await asyncio.wait_for(_recv(), timeout)
-        except TimeoutError as ex:
-            if unique_id is not None:
-                raise HomeVentilationControlTimeoutException(f"no answer from device '{unique_id}'") from ex
-        except OSError as ex:
-            raise HomeVentilationControlException("error with socket communication") from ex
-        return None, None
+            points = [(round(x), round(y)) for x, y in points]
+        except (TypeError, ValueError) as ex:
+            raise ValueError(f"fan curve points must be [level, speed] pairs: {points!r}") from ex
+        if not points:
+            raise ValueError("fan curve needs at least one point")
+        for x, y in points:
+            if not (0 <= x <= 100 and 0 <= y <= 100):
+                raise ValueError(f"fan curve point {[x, y]} is outside 0-100")
+        if any(x0 >= x1 for (x0, _), (x1, _) in zip(points, points[1:])):
+            raise ValueError(f"fan curve levels must increase: {[x for x, _ in points]}")
+        self.points = self._minimize(points)
+
+    @staticmethod
+    def _minimize(points):
+        """Drop points which don't change the curve, keeping at least two like the integration always sent."""
+        kept = []
+        for point in points:
+            # The middle one of three collinear points is redundant.
+            while len(kept) >= 2 and (kept[-1][1] - kept[-2][1]) * (point[0] - kept[-2][0]) == (point[1] - kept[-2][1]) * (kept[-1][0] - kept[-2][0]):
+                kept.pop()
+            kept.append(point)
+        # So is a first or last point on a flat end.
+        while len(kept) > 2 and kept[0][1] == kept[1][1]:
+            kept.pop(0)
+        while len(kept) > 2 and kept[-1][1] == kept[-2][1]:
+            kept.pop()
+        return tuple(kept)
 
     @classmethod
-    async def discover(cls, discovery_address, unique_id = None, broadcast = False) -> dict[str, '__class__']:
-        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        s.setblocking(False)
-        if broadcast:
-            s.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-        try:
-            s.sendto(json.dumps({"HomeVentilationControl": {}}).encode(), discovery_address)
-        except BaseException as ex:
-            s.close()
-            raise HomeVentilationControlException(f"Cannot connect to {discovery_address}: {ex}") from ex
+    def from_adjustment(cls, value: float):
+        """The curve which scales the speed down by -value % or raises the lowest speed to value %."""
+        if value < 0:
+            return cls([(0, 0), (100, round(value) + 100)])
+        return cls([(0, round(value)), (100, 100)])
 
-        s.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 0)
-        replies = [await cls._async_recvfrom(s, unique_id)]
-        if replies[-1][0] and not unique_id:
-            await asyncio.sleep(1)
-            while replies[-1][0]:
-                replies.append(cls._recvfrom(s))
-
-        discovered = {}
-        for data, peer in replies:
-            peer = peer if broadcast else discovery_address
-            if data and (u := data["unique_id"]) not in discovered:
-                discovered[u] = cls(data, peer, s)
-                s = None
-        if s:
-            s.close()
-        return discovered
+    def adjustment(self):
+        """The value of from_adjustment() which gives this curve, or None."""
+        value = self(0) or self(100) - 100
+        return round(value) if self == self.from_adjustment(value) else None
+
+    def lowers_speed(self) -> bool:
+        """Whether the curve is below the native level anywhere."""
+        return any(self(x) < x for x in [0, 100] + [x for x, _ in self.points])
+
+    def ttl(self, duration: float | None = None) -> int:
+        """The TTL to send the curve with; lowering the speed is riskier, so it expires sooner.
+
+        With a duration (seconds), the TTL ends with it at the latest.
+        """
+        ttl = self.MAX_LOW_TIME if self.lowers_speed() else self.MAX_HIGH_TIME
+        if duration is not None:
+            ttl = min(ttl, max(1, round(duration * 1_000)))
+        return ttl
+
+    def encode(self) -> list:
+        """The points for a wifi_N request, as devices also report them."""
+        return [list(point) for point in self.points]
+
+    def __call__(self, level: float) -> float:
+        points = self.points
+        i = bisect.bisect_left(points, (level, -1))
+        if i == 0:
+            return points[0][1]
+        if i == len(points):
+            return points[-1][1]
+        (x0, y0), (x1, y1) = points[i - 1], points[i]
+        return y0 + (y1 - y0) * (level - x0) / (x1 - x0)
+
+    def __eq__(self, other):
+        return isinstance(other, HomeVentilationControlFanCurve) and self.points == other.points
+
+    def __hash__(self):
+        return hash(self.points)
+
+    def __repr__(self):
+        return f"HomeVentilationControlFanCurve({self.encode()!r})"
+
+class HomeVentilationControlHumidityBoost:
+    """Boost a fan of a device while the relative humidity is high.
+
+    The boost starts when the humidity reaches setpoint and stops when it
+    falls to setpoint - hysteresis (in % RH). The state changes at most
+    once per min_interval seconds. While boosting, the fan curve raises
+    the speed to at least boost % and is held, so it is renewed as usual.
+    Call update() after every packet from the device.
+    """
+
+    MIN_INTERVAL = 60
+    # TTL of the boost curve (ms); if the integration stops, the boost ends this soon.
+    BOOST_TTL = 3600_000
+    # TTL of the neutral curve which ends a boost (ms).
+    END_TTL = 1_000
+
+    __slots__ = ("device", "fan", "setpoint", "hysteresis", "boost", "min_interval", "active", "_time_changed")
+
+    def __init__(self, device, fan = "0", setpoint: float = 65, hysteresis: float = 5, boost: float = 50, min_interval: float = MIN_INTERVAL):
+        self.device = device
+        self.fan = str(fan)
+        self.setpoint = setpoint
+        self.hysteresis = hysteresis
+        self.boost = boost
+        self.min_interval = min_interval
+        self.active = False
+        self._time_changed = 0
+
+    def update(self):
+        """Start or stop the boost according to the latest humidity; return whether it changed."""
+        rh = self.device.get("air.rh")
+        now = time.time()
+        if rh is None or self.device.timeout() or now < self._time_changed + self.min_interval:
+            return False
+        rh /= 10
+        if self.active and rh > self.setpoint - self.hysteresis or not self.active and rh < self.setpoint:
+            return False
+        self.device.queue_command(self._set(not self.active))
+        self._time_changed = now
+        return True
+
+    def stop(self):
+        """End the boost now, e.g. before the device is closed."""
+        if self.active:
+            self.device.send(self._set(False))
+
+    def _set(self, active: bool) -> dict:
+        """Change the state and return the command for it."""
+        self.active = active
+        if active:
+            points, ttl = HomeVentilationControlFanCurve.from_adjustment(self.boost).encode(), self.BOOST_TTL
+            self.device.hold(self.fan, points, ttl)
+        else:
+            points, ttl = HomeVentilationControlFanCurve.from_adjustment(0).encode(), self.END_TTL
+            self.device.release(self.fan)
+        _LOGGER.debug("%s: humidity boost of fan %s %s", self.device.name, self.fan, "started" if active else "ended")
+        return {f"wifi_{self.fan}": points, f"wifi_{self.fan}_ttl": ttl, "udp_force_update": 1}
+
+class HomeVentilationControlWindow:
+    """Aggregate samples over windows of seconds and publish their mean, min and max.
+
+    add() returns True when a value should be published: for the first
+    sample and for the first sample after each window, which closes it.
+    """
+
+    __slots__ = ("seconds", "ndigits", "value", "attributes", "_start", "_count", "_sum", "_min", "_max")
+
+    def __init__(self, seconds: float, ndigits: int = 1):
+        self.seconds = seconds
+        self.ndigits = ndigits
+        self.value = None
+        self.attributes = {}
+        self._start = None
+
+    def add(self, value, now: float | None = None) -> bool:
+        now = time.time() if now is None else now
+        published = self._start is None
+        if published:
+            self.value = value
+        elif now >= self._start + self.seconds:
+            self.value = round(self._sum / self._count, self.ndigits)
+            self.attributes = {"min": self._min, "max": self._max, "samples": self._count}
+            published = True
+        else:
+            self._count += 1
+            self._sum += value
+            self._min = min(self._min, value)
+            self._max = max(self._max, value)
+            return False
+        self._start, self._count, self._sum, self._min, self._max = now, 1, value, value, value
+        return True
+
+class HomeVentilationControlDeadband:
+    """Publish a sample only if it differs from the published value by at least delta."""
+
+    __slots__ = ("delta", "value", "attributes")
+
+    def __init__(self, delta: float):
+        self.delta = delta
+        self.value = None
+        self.attributes = {}
+
+    def add(self, value, now: float | None = None) -> bool:
+        if self.value is not None and abs(value - self.value) < self.delta:
+            return False
+        self.value = value
+        return True
+
+class HomeVentilationControlHistory:
+    """The latest samples of numeric paths of a device, in fixed-size arrays.
+
+    Samples are kept in a ring of size rows of doubles, so memory use does
+    not grow: 8 bytes per path and sample plus 8 for the time. Missing and
+    non-numeric values are stored as NaN.
+    """
+
+    SIZE = 360
+
+    __slots__ = ("paths", "size", "count", "_next", "_times", "_values")
+
+    def __init__(self, paths, size: int = SIZE):
+        self.paths = tuple(paths)
+        self.size = size
+        self.count = 0
+        self._next = 0
+        self._times = array("d", bytes(8 * size))
+        self._values = array("d", bytes(8 * size * len(self.paths)))
+
+    def append(self, values, when: float):
+        """Add a sample of values (in the order of paths) taken at time when."""
+        i = self._next
+        self._times[i] = when
+        row = i * len(self.paths)
+        for j, value in enumerate(values):
+            self._values[row + j] = value if isinstance(value, (int, float)) else math.nan
+        self._next = (i + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+
+    def samples(self, last: int | None = None) -> dict[str, list]:
+        """The latest samples, oldest first, as columns: {"time": [...], path: [...]}; NaN becomes None."""
+        n = self.count if last is None else max(0, min(last, self.count))
+        rows = [(self._next - n + k) % self.size for k in range(n)]
+        width = len(self.paths)
+        columns = {"time": [self._times[i] for i in rows]}
+        for j, path in enumerate(self.paths):
+            values = (self._values[i * width + j] for i in rows)
+            columns[path] = [None if value != value else value for value in values]
+        return columns
+
+    def clear(self):
+        self.count = self._next = 0
+
+class HomeVentilationControlStats:
+    """Transport telemetry of a device (or of a hub), cheap to update for every packet."""
+
+    __slots__ = ("packets", "bytes", "dropped", "interval", "interval_histogram", "loss", "rtt", "_intervals", "_time_received", "_time_requested")
+
+    # The interval is the median of this many recent ones, and unknown until there are this many.
+    INTERVAL_SAMPLES = 7
+
+    # Upper bounds (seconds) of the packet interval histogram; the last bucket is unbounded.
+    INTERVAL_BUCKETS = (1, 5, 15, 60, 300, 900)
+
+    def __init__(self):
+        self.packets = 0
+        self.bytes = 0
+        # Dropped packets by reason: undecodable, or from the device's address with another unique_id.
+        self.dropped = {"invalid": 0, "unique_id": 0}
+        # Typical seconds between pushed packets, their distribution, and
+        # the smoothed fraction of pushes which seem to have been lost.
+        self.interval = None
+        self._intervals = array("d")
+        self.interval_histogram = [0] * (len(self.INTERVAL_BUCKETS) + 1)
+        self.loss = 0.0
+        # Seconds from the latest request to the next packet.
+        self.rtt = None
+        self._time_received = None
+        self._time_requested = None
+
+    def received(self, size: int, resumed: bool = False):
+        """Count a packet; resumed if it ends an outage of the device."""
+        now = time.monotonic()
+        self.packets += 1
+        self.bytes += size
+        if resumed:
+            # The pending request may be from long before, and the gap is no push interval.
+            self._time_requested = None
+        elif self._time_requested is not None:
+            # A reply to a request says nothing about the push cadence.
+            self.rtt = now - self._time_requested
+            self._time_requested = None
+        elif self._time_received is not None:
+            interval = now - self._time_received
+            if self.interval is not None:
+                missed = max(0, round(interval / self.interval) - 1)
+                self.loss += (missed / (missed + 1) - self.loss) / 8
+            # A median ignores odd gaps and the doubled intervals of single losses.
+            if len(self._intervals) == self.INTERVAL_SAMPLES:
+                self._intervals.pop(0)
+            self._intervals.append(interval)
+            if len(self._intervals) == self.INTERVAL_SAMPLES:
+                self.interval = sorted(self._intervals)[self.INTERVAL_SAMPLES // 2]
+            self.interval_histogram[bisect.bisect_left(self.INTERVAL_BUCKETS, interval)] += 1
+        self._time_received = now
+
+    def requested(self):
+        """Note that a request was sent; the next packet completes the round trip."""
+        if self._time_requested is None:
+            self._time_requested = time.monotonic()
+
+    def histogram(self) -> dict[str, int]:
+        """The packet interval histogram keyed by bucket upper bound."""
+        labels = [f"<= {bound} s" for bound in self.INTERVAL_BUCKETS] + [f"> {self.INTERVAL_BUCKETS[-1]} s"]
+        return dict(zip(labels, self.interval_histogram))
+
+    def as_dict(self) -> dict:
+        return {
+            "packets": self.packets,
+            "bytes": self.bytes,
+            "dropped": dict(self.dropped),
+            "interval": self.interval,
+            "interval_histogram": self.histogram(),
+            "loss": self.loss,
+            "rtt": self.rtt,
+        }
+
+class HomeVentilationControlProfiler:
+    """Timing of the packet path of a hub, and optionally a cProfile capture of it.
+
+    For each packet it measures decoding and dispatching, which includes
+    device callbacks and the state writes they cause, and counts the
+    entities written (reported with entity_written()).
+    """
+
+    __slots__ = ("packets", "decode", "dispatch", "entities", "capture", "_start", "_decoded", "_entities")
+
+    def __init__(self):
+        self.packets = 0
+        # [total, max] of seconds or entities per packet.
+        self.decode = [0.0, 0.0]
+        self.dispatch = [0.0, 0.0]
+        self.entities = [0, 0]
+        # cProfile.Profile enabled only while a packet is handled.
+        self.capture = None
+        self._start = self._decoded = 0.0
+        self._entities = 0
+
+    def begin(self):
+        if self.capture:
+            try:
+                self.capture.enable()
+            except ValueError as ex:
+                # Another profiler is active, e.g. that of Home Assistant's profiler integration.
+                _LOGGER.warning("Cannot capture a profile of the packet path: %s", ex)
+                self.capture = None
+        self._entities = 0
+        self._start = time.perf_counter()
+
+    def decoded(self):
+        self._decoded = time.perf_counter()
+
+    def end(self):
+        now = time.perf_counter()
+        if self.capture:
+            self.capture.disable()
+        self.packets += 1
+        for totals, value in ((self.decode, self._decoded - self._start), (self.dispatch, now - self._decoded), (self.entities, self._entities)):
+            totals[0] += value
+            totals[1] = max(totals[1], value)
+
+    def entity_written(self):
+        self._entities += 1
+
+    def start_capture(self) -> cProfile.Profile:
+        """Start capturing; returns the cProfile.Profile to pass to stop_capture()."""
+        if self.capture is not None:
+            raise HomeVentilationControlException("a capture is already running")
+        self.capture = cProfile.Profile()
+        return self.capture
+
+    def stop_capture(self, capture: cProfile.Profile):
+        """Stop capturing into capture, which can then be written with dump_stats() for pstats or snakeviz.
+
+        Call it from the thread of the packet path; dumping may block and can be done elsewhere.
+        """
+        if self.capture is capture:
+            self.capture = None
+        capture.disable()
+
+    def as_dict(self) -> dict:
+        """Means and maxima per packet; times in milliseconds."""
+        n = self.packets or 1
+        return {
+            "packets": self.packets,
+            "decode_ms": {"mean": self.decode[0] / n * 1_000, "max": self.decode[1] * 1_000},
+            "dispatch_ms": {"mean": self.dispatch[0] / n * 1_000, "max": self.dispatch[1] * 1_000},
+            "entities_written": {"mean": self.entities[0] / n, "max": self.entities[1]},
+            "capturing": self.capture is not None,
+        }
+
+class HomeVentilationControlProtocol(asyncio.DatagramProtocol):
+    """Datagram protocol which hands each packet to its hub as it arrives."""
+
+    def __init__(self, hub):
+        self.hub = hub
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
 
-    def __init__(self, data, peer, socket_):
-        self.socket = socket_ or socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.socket.setblocking(False)
-        self.socket.connect(peer)
+    def connection_lost(self, ex):
+        self.hub._connection_lost(self.transport, ex)
+
+    def datagram_received(self, data, peer):
+        self.hub._datagram_received(data, peer)
+
+    def error_received(self, ex):
+        # ICMP errors (e.g. port unreachable) are expected while a device is offline.
+        pass
+
+class HomeVentilationControlDevice:
+    REQUEST_TIMEOUT = 5
+    KEEPALIVE_INTERVAL = 303
+    UPDATE_TIMEOUT = 910
+    # Keepalive interval for devices which push regularly without losses.
+    HEALTHY_KEEPALIVE_INTERVAL = 600
+    # Lower bound for the adaptive update timeout.
+    MIN_UPDATE_TIMEOUT = 15
+    # Update timeout while the data is a stale snapshot (e.g. from a cache).
+    STALE_TIMEOUT = 60
+    DEFAULT_PORT = 38866
+    # Minimum time between two queued commands, to protect the device.
+    COMMAND_INTERVAL = 1.0
+    # Held wifi_N points are renewed this many seconds before their TTL runs out.
+    HOLD_RENEW_MARGIN = 60
+    # Minimum time between two renewals, e.g. while the device does not answer.
+    HOLD_RETRY_INTERVAL = 15
+
+    __slots__ = (
+        "hub", "unique_id", "layout", "record", "peer", "address", "changed_paths", "stale",
+        "_time_updated", "_time_keepalive", "_callback", "_tick_at", "_probed", "_timeout_reported",
+        "command_interval", "_pending_command", "_command_timer", "_time_command", "_command_generations", "command_latency", "stats",
+        "holds", "_time_hold_sent", "history", "fields", "_fields_id", "_fields_layout", "_fields_index",
+    )
+
+    def __init__(self, data, peer, hub, address = None):
+        self.hub = hub
         self.unique_id = data["unique_id"]
-        self.data = data
+        # The decoded packet, or a tuple of values if a layout is set.
+        self.layout = None
+        self.record = data
+        # The configured peer may be a host name; packets are sent to the
+        # address the device last sent from.
         self.peer = peer
+        self.address = address or peer
+        # Paths changed by the latest packet; None means everything.
+        self.changed_paths = None
+        # True until the first packet if the data is an old snapshot.
+        self.stale = False
         self._time_updated = time.time()
         self._time_keepalive = 0
+        self._callback = None
+        # Time of the next scheduled _tick(); see HomeVentilationControlHub.schedule.
+        self._tick_at = None
+        self._probed = False
+        self._timeout_reported = False
+        self.command_interval = self.COMMAND_INTERVAL
+        self._pending_command = {}
+        self._command_timer = None
+        self._time_command = None
+        # Request key -> generation of the latest send_and_confirm() which sets it.
+        self._command_generations = {}
+        # Seconds from sending the latest confirmed command to its confirmation.
+        self.command_latency = None
+        self.stats = HomeVentilationControlStats()
+        # Fan -> (TTL in ms, points, end time or None) of the wifi_N points held active.
+        self.holds = {}
+        self._time_hold_sent = 0
+        # HomeVentilationControlHistory of recent packets, if wanted.
+        self.history = None
+        # Paths subscribed to with subscribe(), or None for whole packets.
+        self.fields = None
+        self._fields_id = None
+        self._fields_layout = None
+        self._fields_index = None
+
+    @property
+    def data(self) -> dict:
+        """The latest data as nested dicts; rebuilt from the record if a layout is set."""
+        if self.layout is None:
+            return self.record
+        return self.layout.to_dict(self.record) | {"unique_id": self.unique_id}
+
+    def set_layout(self, layout: HomeVentilationControlLayout | None):
+        """Keep only the paths of layout from now on (or everything if None)."""
+        data = self.data
+        self.layout = layout
+        self.record = data if layout is None else layout.extract(data)
+        self._index_fields()
+
+    def subscribe(self, paths):
+        """Ask the device to push only paths, as a compact list of values (or everything if empty).
+
+        Requests carry "fields" (the paths) and "fields_id" (their checksum).
+        A device which supports them pushes {"unique_id", "fields_id",
+        "values"} to this sender; values of other fields_ids are ignored
+        and the subscription is renewed. Devices which don't support it
+        keep sending whole packets, which are decoded as before. Discovery
+        requests are always answered with whole packets.
+        """
+        self.fields = tuple(dict.fromkeys(paths)) or None
+        self._fields_id = self.fields and zlib.crc32(",".join(self.fields).encode())
+        self._fields_layout = self.fields and HomeVentilationControlLayout(self.fields)
+        self._index_fields()
+        self.send({} if self.fields else {"fields": []})
+
+    def _index_fields(self):
+        if self.fields and self.layout is not None:
+            self._fields_index = tuple(self.layout.index.get(path) for path in self.fields)
+        else:
+            self._fields_index = None
+
+    async def start(self, callback = None):
+        """Start receiving push data; callback(device) is called for every update and on timeout."""
+        self._callback = callback
+        self.hub.add(self)
+        self._tick()
+
+    def keepalive_interval(self):
+        """Seconds between keepalives: longer while pushes arrive regularly."""
+        # The stats are of the time before an outage; missed pushes are not counted.
+        if self.stats.interval is not None and self.stats.loss < 0.05 and not self.stale and not self.timeout():
+            return self.HEALTHY_KEEPALIVE_INTERVAL
+        return self.KEEPALIVE_INTERVAL
+
+    def update_timeout(self):
+        """Seconds of silence after which the device is considered offline.
+
+        Three push intervals once the push cadence is known, else UPDATE_TIMEOUT.
+        """
+        if self.stale:
+            return self.STALE_TIMEOUT
+        if self.stats.interval is None:
+            return self.UPDATE_TIMEOUT
+        return min(max(3 * self.stats.interval, self.MIN_UPDATE_TIMEOUT), self.UPDATE_TIMEOUT)
+
+    def _tick(self):
+        """Send keepalives, probes and hold renewals and report timeouts; run by the hub's scheduler."""
+        now = time.time()
+        for fan in [fan for fan, (_, _, until) in self.holds.items() if until is not None and until <= now]:
+            del self.holds[fan]
+        if (renew_at := self._renew_at()) is not None and renew_at <= now:
+            self._renew_holds(now)
+            renew_at = self._renew_at()
+        timeout = self.update_timeout()
+        probe_at = self._time_updated + timeout / 2
+        if now >= self._time_keepalive + self.keepalive_interval() or (now >= probe_at and not self._probed):
+            # A silent device gets one probe which asks for an immediate push.
+            self._probed = now >= probe_at
+            self.send({"udp_force_update": 1} if self._probed else {})
+        if self.timeout():
+            if not self._timeout_reported and self._callback:
+                self._timeout_reported = True
+                self._callback(self)
+            timeout_at = now + self.KEEPALIVE_INTERVAL
+        else:
+            timeout_at = self._time_updated + timeout
+        next_at = min(self._time_keepalive + self.keepalive_interval(), timeout_at)
+        if not self._probed:
+            next_at = min(next_at, max(probe_at, now))
+        if renew_at is not None:
+            next_at = min(next_at, renew_at)
+        self.hub.schedule(self, max(next_at, now + 0.1))
+
+    def _reschedule(self, when):
+        """Run _tick() earlier than scheduled, if the device is started."""
+        if self._tick_at is not None and when < self._tick_at:
+            self.hub.schedule(self, when)
+
+    def _received(self, data, peer, size = 0):
+        self.stats.received(size, self.timeout())
+        if (values := data.get("values")) is not None:
+            if not self.fields or data.get("fields_id") != self._fields_id or len(values) != len(self.fields):
+                # Values of an old subscription, e.g. from before a restart.
+                self.send({} if self.fields else {"fields": []})
+                return
+            if self.layout is None:
+                data = self._fields_layout.to_dict(values) | {"unique_id": self.unique_id}
+        if self.layout is None:
+            record, diff = data, diff_paths
+        elif values is not None:
+            record = [None] * len(self.layout.paths)
+            for i, value in zip(self._fields_index, values):
+                if i is not None:
+                    record[i] = value
+            record, diff = tuple(record), self.layout.diff
+        else:
+            record, diff = self.layout.extract(data), self.layout.diff
+        self.changed_paths = diff(self.record, record) if not self.timeout() and not self.stale else None
+        self.stale = False
+        self.record = record
+        self.address = peer
+        self._time_updated = time.time()
+        self._probed = False
+        self._timeout_reported = False
+        if self.history is not None:
+            self.history.append([self.get(path) for path in self.history.paths], self._time_updated)
+        # The learned push cadence may move the next probe earlier.
+        self._reschedule(self._time_updated + self.update_timeout() / 2)
+        if (renew_at := self._renew_at()) is not None:
+            self._reschedule(renew_at)
+        if self._callback:
+            self._callback(self)
 
     def send(self, request = {}):
-        self.socket.send(json.dumps({"HomeVentilationControl": request | {"unique_id": self.unique_id}}).encode())
+        request = request | {"unique_id": self.unique_id}
+        if self.fields:
+            request["fields"] = self.fields
+            request["fields_id"] = self._fields_id
+        try:
+            self.hub.sendto(self.hub.codec.dumps({"HomeVentilationControl": request}), self.address)
+        except HomeVentilationControlException as ex:
+            # The device times out as usual while the hub has no endpoint.
+            _LOGGER.debug("Cannot send to %s: %s", self.unique_id, ex)
+            return
+        self.stats.requested()
         self._time_keepalive = time.time()
 
+    def queue_command(self, request):
+        """Send a command, merging it with pending ones and spacing sends by command_interval.
+
+        Pending requests are merged key by key (the last write wins), so a
+        burst of wifi_N / wifi_N_ttl updates becomes a single packet.
+        """
+        self._pending_command.update(request)
+        if self._command_timer:
+            return
+        loop = asyncio.get_running_loop()
+        delay = 0 if self._time_command is None else self._time_command + self.command_interval - loop.time()
+        if delay > 0:
+            self._command_timer = loop.call_later(delay, self._send_pending_command)
+        else:
+            self._send_pending_command()
+
+    def _send_pending_command(self):
+        self._command_timer = None
+        request, self._pending_command = self._pending_command, {}
+        if request:
+            self._time_command = asyncio.get_running_loop().time()
+            self.send(request)
+
+    @staticmethod
+    def _wifi_confirmation(request):
+        """Make a function which checks that a device shows the wifi_N points of request as active."""
+        expected = [
+            (f"{key[5:]}.wifi.valid", f"{key[5:]}.wifi.points", [list(point) for point in points])
+            for key, points in request.items()
+            if key.startswith("wifi_") and not key.endswith("_ttl")
+        ]
+        return lambda device: all(device.get(valid) and device.get(get_points) == points for valid, get_points, points in expected)
+
+    async def send_and_confirm(self, request, confirmed = None, timeout: float = REQUEST_TIMEOUT, retry_delay: float = 0.25):
+        """Send a command and resend it with backoff until pushed data confirms it.
+
+        confirmed(device) decides whether the command has been applied; by
+        default the wifi_N points of the request must be active. Returns the
+        latency from the first send to the confirmation, which is also kept
+        in command_latency. Raises HomeVentilationControlSupersededException,
+        without resending, once a newer call sets any of the same keys.
+        """
+        confirmed = confirmed or self._wifi_confirmation(request)
+        keys = request.keys() - {"udp_force_update"}
+        generation = max(self._command_generations.values(), default = 0) + 1
+        self._command_generations.update(dict.fromkeys(keys, generation))
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        deadline = start + timeout
+        while True:
+            if any(self._command_generations[key] != generation for key in keys):
+                raise HomeVentilationControlSupersededException(f"a newer command for device '{self.unique_id}' replaced this one")
+            # Ask for an immediate push instead of waiting for the next periodic one.
+            self.queue_command(request | {"udp_force_update": 1})
+            attempt_deadline = min(deadline, loop.time() + retry_delay)
+            while (remaining := attempt_deadline - loop.time()) > 0:
+                try:
+                    await self.wait(remaining)
+                except HomeVentilationControlTimeoutException:
+                    break
+                if confirmed(self):
+                    self.command_latency = loop.time() - start
+                    return self.command_latency
+            if loop.time() >= deadline:
+                raise HomeVentilationControlTimeoutException(f"device '{self.unique_id}' did not confirm the command")
+            retry_delay *= 2
+
+    def hold(self, fan, points, ttl: int, duration: float | None = None):
+        """Keep the wifi_N points of fan active by renewing them before their TTL (ms) runs out.
+
+        The hold ends after duration seconds, or never if None; the last
+        renewal is shortened to end with it. If the integration stops, the
+        device falls back to its own level when the TTL expires as usual.
+        The points are not sent now; see send_and_confirm.
+        """
+        until = None if duration is None else time.time() + duration
+        self.holds[str(fan)] = (ttl, [list(point) for point in points], until)
+        self._reschedule(self._renew_at())
+
+    def release(self, fan):
+        """Stop renewing the wifi_N points of fan; the device keeps them until the TTL expires."""
+        self.holds.pop(str(fan), None)
+
+    def _renew_at(self):
+        """Time of the next renewal of held points, or None if nothing is held."""
+        renew_at = None
+        for fan, (ttl, points, until) in self.holds.items():
+            at = self._time_hold_sent + self.HOLD_RETRY_INTERVAL
+            if self.get(f"{fan}.wifi.valid") and self.get(f"{fan}.wifi.points") == points:
+                expires = self._time_updated + (self.get(f"{fan}.wifi.ttl") or 0) / 1_000
+                if until is not None and expires >= until - 1:
+                    # The points already last until the end of the hold.
+                    at = until
+                else:
+                    at = max(at, expires - self.HOLD_RENEW_MARGIN)
+            if until is not None:
+                at = min(at, until)
+            renew_at = at if renew_at is None else min(renew_at, at)
+        return renew_at
+
+    def _renew_holds(self, now):
+        """Send the points of all holds in one command."""
+        request = {"udp_force_update": 1}
+        for fan, (ttl, points, until) in self.holds.items():
+            request[f"wifi_{fan}"] = points
+            request[f"wifi_{fan}_ttl"] = ttl if until is None else min(ttl, round((until - now) * 1_000))
+        self._time_hold_sent = now
+        self.queue_command(request)
+
     def force_update(self):
         self.send({"udp_force_update": 1})
         # FIXME: Wait for response?
 
-    def recv(self):
-        while self.socket:
-            data, peer = self._recvfrom(self.socket, self.unique_id)
-            if not data:
-                break
-            self.data = data
-            self._time_updated = time.time()
-
-    async def wait(self):
-        data, peer = await self._async_recvfrom(self.socket, self.unique_id)
-        self.data = data
-        self._time_updated = time.time()
+    async def wait(self, timeout: float = REQUEST_TIMEOUT):
+        """Wait for the next packet from the device."""
+        waiter = asyncio.get_running_loop().create_future()
+        def _watcher(data, peer):
+            if data["unique_id"] == self.unique_id and not waiter.done():
+                if self.hub.devices.get(self.unique_id) is not self:
+                    self._received(data, peer)
+                waiter.set_result(None)
+        remove_watcher = self.hub.watch(_watcher)
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except TimeoutError as ex:
+            raise HomeVentilationControlTimeoutException(f"no answer from device '{self.unique_id}'") from ex
+        finally:
+            remove_watcher()
 
     def keep_alive(self):
-        if self._time_keepalive < time.time() - self.KEEPALIVE_INTERVAL:
+        if self._time_keepalive < time.time() - self.keepalive_interval():
             self.send()
 
     def timeout(self):
-        return self._time_updated < time.time() - self.UPDATE_TIMEOUT
+        return self._time_updated < time.time() - self.update_timeout()
+
+    def changed(self, path):
+        """Whether the latest packet changed the value at path (or anything under it)."""
+        return self.changed_paths is None or path in self.changed_paths
 
     def get(self, path):
-        try:
-            d = self.data
-            for component in path.split("."):
-                d = d[component]
-            return d
-        except:
-            return None
+        if self.layout is None:
+            return compile_path(path)(self.record)
+        if (i := self.layout.index.get(path)) is not None:
+            return self.record[i]
+        return compile_path(path)(self.data)
 
     def close(self):
-        self.socket.close()
+        if self.fields:
+            # Else the device keeps pushing compact packets until the subscription expires.
+            self.subscribe(())
+        self._tick_at = None
+        self.holds.clear()
+        if self._command_timer:
+            self._command_timer.cancel()
+            self._command_timer = None
+        self._pending_command = {}
+        self.hub.remove(self)
 
     @property
     def name(self):
         return self.get("conf.name") or self.unique_id
 
+class HomeVentilationControlHub:
+    """One UDP endpoint shared by all HomeVentilationControl devices.
+
+    Incoming packets are dispatched to started devices by unique_id, so the
+    number of sockets does not grow with the number of devices.
+    """
+
+    RECEIVE_BUFFER_SIZE = 1 << 20
+
+    def __init__(self, codec: Codec = DEFAULT_CODEC):
+        self.codec = codec
+        self.devices: dict[str, HomeVentilationControlDevice] = {}
+        self._by_address: dict[tuple, HomeVentilationControlDevice] = {}
+        # Packets which could not be attributed to any device.
+        self.stats = HomeVentilationControlStats()
+        # Heap of (time, seq, device) for device ticks, served by one timer.
+        self._schedule = []
+        self._schedule_seq = itertools.count()
+        self._timer = None
+        self._timer_at = None
+        self._watchers = []
+        self._transport = None
+        self._started = None
+        self._local_address = None
+        # HomeVentilationControlProfiler of the packet path, if wanted.
+        self.profiler = None
+
+    async def start(self, local_address = ("0.0.0.0", 0)):
+        """Open the shared endpoint; safe to call (and await) many times."""
+        if self._started is None:
+            loop = asyncio.get_running_loop()
+            self._started = asyncio.ensure_future(loop.create_datagram_endpoint(lambda: HomeVentilationControlProtocol(self), local_addr = local_address, family = socket.AF_INET, allow_broadcast = True))
+        try:
+            self._transport, _ = await asyncio.shield(self._started)
+        except OSError as ex:
+            self._started = None
+            raise HomeVentilationControlException(f"Cannot open UDP endpoint {local_address}: {ex}") from ex
+        # Reopen on the same port if the endpoint is lost.
+        self._local_address = self._transport.get_extra_info("sockname")[:2]
+        try:
+            # Discovery replies from a big fleet arrive in one burst.
+            self._transport.get_extra_info("socket").setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.RECEIVE_BUFFER_SIZE)
+        except OSError:
+            pass
+
+    @property
+    def port(self):
+        """The local port of the endpoint, or None if not started."""
+        return self._transport.get_extra_info("sockname")[1] if self._transport else None
+
+    def close(self):
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        self._schedule.clear()
+        if self._transport:
+            self._transport.close()
+            self._transport = None
+        self._started = None
+
+    def schedule(self, device: HomeVentilationControlDevice, when: float):
+        """Call device._tick() at time.time() == when, replacing its earlier schedule.
+
+        All devices share one timer, armed for the earliest tick. Replaced
+        entries stay in the heap and are skipped when they come up.
+        """
+        device._tick_at = when
+        heapq.heappush(self._schedule, (when, next(self._schedule_seq), device))
+        if self._timer_at is None or when < self._timer_at:
+            self._arm_timer()
+
+    def _arm_timer(self):
+        if self._timer:
+            self._timer.cancel()
+            self._timer = self._timer_at = None
+        if self._schedule:
+            self._timer_at = self._schedule[0][0]
+            self._timer = asyncio.get_running_loop().call_later(max(0, self._timer_at - time.time()), self._run_schedule)
+
+    def _run_schedule(self):
+        self._timer = self._timer_at = None
+        now = time.time()
+        while self._schedule and self._schedule[0][0] <= now:
+            when, _, device = heapq.heappop(self._schedule)
+            if device._tick_at == when:
+                device._tick_at = None
+                device._tick()
+        self._arm_timer()
+
+    def add(self, device: HomeVentilationControlDevice):
+        self.devices[device.unique_id] = device
+        self._by_address[device.address] = device
+
+    def remove(self, device: HomeVentilationControlDevice):
+        if self.devices.get(device.unique_id) is device:
+            del self.devices[device.unique_id]
+        if self._by_address.get(device.address) is device:
+            del self._by_address[device.address]
+
+    def watch(self, callback):
+        """Call callback(data, peer) for every valid packet; returns a function to stop watching."""
+        self._watchers.append(callback)
+        return lambda: self._watchers.remove(callback)
+
+    def _connection_lost(self, transport, ex):
+        """Forget an endpoint which closed by itself and open it again."""
+        if transport is not self._transport:
+            # Closed by close().
+            return
+        _LOGGER.warning("UDP endpoint closed unexpectedly (%s); reopening it", ex)
+        self._transport = None
+        self._started = None
+        asyncio.get_running_loop().create_task(self._reopen())
+
+    async def _reopen(self):
+        try:
+            await self.start(self._local_address)
+        except HomeVentilationControlException as ex:
+            try:
+                await self.start()
+            except HomeVentilationControlException:
+                _LOGGER.error("%s; devices stay offline until the endpoint is opened again", ex)
+
+    def sendto(self, data: bytes, address):
+        if not self._transport:
+            raise HomeVentilationControlException("hub is not started")
+        self._transport.sendto(data, address)
+
+    def decode(self, data: bytes):
+        """Decode a datagram into its "HomeVentilationControl" object, or None if invalid."""
+        try:
+            data = self.codec.loads(data)["HomeVentilationControl"]
+        except (ValueError, KeyError, TypeError):
+            return None
+        return data if isinstance(data, dict) and "unique_id" in data else None
+
+    def _datagram_received(self, packet, peer):
+        if (profiler := self.profiler) is None:
+            self._dispatch(self.decode(packet), packet, peer)
+            return
+        profiler.begin()
+        try:
+            data = self.decode(packet)
+            profiler.decoded()
+            self._dispatch(data, packet, peer)
+        finally:
+            profiler.end()
+
+    def _dispatch(self, data, packet, peer):
+        if data and (device := self.devices.get(data["unique_id"])):
+            if device.address != peer:
+                self.remove(device)
+                device.address = peer
+                self.add(device)
+            device._received(data, peer, len(packet))
+        elif (owner := self._by_address.get(peer)) is not None:
+            owner.stats.dropped["invalid" if data is None else "unique_id"] += 1
+        elif data is None:
+            self.stats.dropped["invalid"] += 1
+        # Valid packets from unknown devices are for discovery.
+        if data is None:
+            return
+        for watcher in tuple(self._watchers):
+            watcher(data, peer)
+
+    async def send_and_confirm_all(self, devices, request, limit: int = 32) -> dict[str, float | HomeVentilationControlException]:
+        """Send the same command to many devices concurrently, confirming at most limit at a time.
+
+        Returns the latency or the exception of each device by unique_id.
+        """
+        confirmed = HomeVentilationControlDevice._wifi_confirmation(request)
+        semaphore = asyncio.Semaphore(limit)
+        async def _send_and_confirm(device):
+            async with semaphore:
+                try:
+                    return await device.send_and_confirm(request, confirmed)
+                except HomeVentilationControlException as ex:
+                    return ex
+        results = await asyncio.gather(*(_send_and_confirm(device) for device in devices))
+        return {device.unique_id: result for device, result in zip(devices, results)}
+
+    async def _resolve(self, discovery_address):
+        # Resolve here; the transport would resolve host names synchronously.
+        loop = asyncio.get_running_loop()
+        try:
+            infos = await loop.getaddrinfo(*discovery_address, family = socket.AF_INET, type = socket.SOCK_DGRAM)
+            return infos[0][4]
+        except (OSError, UnicodeError, ValueError, IndexError) as ex:
+            # UnicodeError: invalid host names like "a..b".
+            raise HomeVentilationControlException(f"Cannot connect to {discovery_address}: {ex}") from ex
+
+    async def discover_iter(self, discovery_addresses, unique_id = None, broadcast = False, timeout: float = HomeVentilationControlDevice.REQUEST_TIMEOUT, settle: float = 1, exclude = ()):
+        """Discover devices at several addresses, yielding each device as soon as it replies.
+
+        All addresses share one deadline, which is shortened to settle seconds
+        after the first reply. With a unique_id, discovery stops at the first match.
+        Replies from unique_ids in exclude are ignored without creating devices.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        replies = asyncio.Queue()
+        remove_watcher = self.watch(lambda data, peer: replies.put_nowait((data, peer)))
+        try:
+            # Map the resolved IP addresses back to the addresses as given.
+            targets = {}
+            resolved = await asyncio.gather(*(self._resolve(a) for a in discovery_addresses), return_exceptions = True)
+            for discovery_address, address in zip(discovery_addresses, resolved):
+                if not isinstance(address, tuple):
+                    _LOGGER.debug("Discovery skipped: %s", address)
+                    continue
+                self.sendto(self.codec.dumps({"HomeVentilationControl": {}}), address)
+                targets[address[0]] = discovery_address
+            if not targets:
+                raise next((a for a in resolved if isinstance(a, HomeVentilationControlException)), HomeVentilationControlException(f"Cannot connect to {discovery_addresses}"))
+
+            discovered = set()
+            while (remaining := deadline - loop.time()) > 0:
+                try:
+                    data, peer = await asyncio.wait_for(replies.get(), remaining)
+                except TimeoutError:
+                    break
+                # Compact pushes of a subscription lack the data of a device.
+                if (u := data["unique_id"]) in discovered or u in exclude or (unique_id is not None and u != unique_id) or "values" in data:
+                    continue
+                if not broadcast and peer[0] not in targets:
+                    continue
+                discovered.add(u)
+                yield HomeVentilationControlDevice(data, peer if broadcast else targets[peer[0]], self, peer)
+                if unique_id is not None:
+                    break
+                deadline = min(deadline, loop.time() + settle)
+        finally:
+            remove_watcher()
+
+    async def discover(self, discovery_address, unique_id = None, broadcast = False) -> dict[str, HomeVentilationControlDevice]:
+        """Discover devices at discovery_address (a host or a broadcast address)."""
+        async with contextlib.aclosing(self.discover_iter([discovery_address], unique_id, broadcast)) as devices:
+            discovered = {device.unique_id: device async for device in devices}
+        if unique_id is not None and not discovered:
+            raise HomeVentilationControlTimeoutException(f"no answer from device '{unique_id}'")
+        return discovered
+
 # CLI test code.
 if __name__ == "__main__":
     import asyncio
 
+    def print_update(device):
+        if device.timeout():
+            print(device.unique_id, "| timeout")
+        else:
+            print(device.unique_id, "|", device.get("clock"), "| c0 =", device.get("0.controller.millivolts"), "mV")
+
     async def main():
+        hub = HomeVentilationControlHub()
+        await hub.start()
         devices = None
-        while True:
-            if not devices:
-                print("discovering...")
-                try:
-                    devices = await HomeVentilationControlDevice.discover(("255.255.255.255", 38866), broadcast = True)
-                except BaseException as ex:
-                    print("Error in discovery:", ex)
-            for device in devices.values():
-                device.keep_alive()
-                device.recv()
-                try:
-                    print(device.get("clock"), "| c0 =", device.get("0.controller.millivolts"), "mV")
-                except BaseException as ex:
-                    print(ex)
-            await asyncio.sleep(5)
+        while not devices:
+            print("discovering...")
+            try:
+                devices = await hub.discover(("255.255.255.255", 38866), broadcast = True)
+            except BaseException as ex:
+                print("Error in discovery:", ex)
+                await asyncio.sleep(5)
+        for device in devices.values():
+            await device.start(print_update)
+        await asyncio.Event().wait()
 
     asyncio.run(main())
@@ -1,16 +1,25 @@
 """Support for HomeVentilationControl numbers, i.e. fan speed adjustment."""
 from __future__ import annotations
 
+from datetime import timedelta
+
+import voluptuous as vol
+
 from .lib import *
 from .entity import HomeVentilationControlEntity, make_device_info
 
 from homeassistant.components.number import NumberEntity, NumberDeviceClass
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers import config_validation as cv, entity_platform
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.helpers.update_coordinator import DataUpdateCoordinator, CoordinatorEntity
 
-from .const import DOMAIN
+from .const import DOMAIN, ATTR_VALUE, ATTR_POINTS, ATTR_HOLD, ATTR_DURATION
+
+SERVICE_HOLD_ADJUSTMENT = "hold_adjustment"
+SERVICE_SET_CURVE = "set_curve"
 
 async def async_setup_entry(
     hass: HomeAssistant,
@@ -27,13 +36,30 @@ async def async_setup_entry(
         HomeVentilationControlFanAdjustmentNumber(info.device, info.coordinator, "kitchen hood adjustment", "1", device_info),
     ])
 
+    platform = entity_platform.async_get_current_platform()
+    platform.async_register_entity_service(
+        SERVICE_HOLD_ADJUSTMENT,
+        {
+            vol.Required(ATTR_VALUE): vol.All(vol.Coerce(float), vol.Range(min = -100, max = 100)),
+            vol.Optional(ATTR_DURATION): cv.positive_time_period,
+        },
+        "async_hold_value",
+    )
+    platform.async_register_entity_service(
+        SERVICE_SET_CURVE,
+        {
+            vol.Required(ATTR_POINTS): HomeVentilationControlFanCurve,
+            vol.Optional(ATTR_HOLD, default = False): cv.boolean,
+            vol.Optional(ATTR_DURATION): cv.positive_time_period,
+        },
+        "async_set_curve",
+    )
+
 
 class HomeVentilationControlFanAdjustmentNumber(CoordinatorEntity, NumberEntity):
     """Representation of a number for adjusting HomeVentilationControl fan level."""
 
     _attr_has_entity_name = True
-    _MAX_LOW_TIME = 3 * 3600_000
-    _MAX_HIGH_TIME = 18 * 3600_000
 
     def __init__(
         self,
@@ -55,27 +81,70 @@ class HomeVentilationControlFanAdjustmentNumber(CoordinatorEntity, NumberEntity)
         self._attr_native_min_value = -100
         self._attr_native_max_value = 100
         self._attr_native_step = 5
+        self._written_available = None
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        """Write state only if the Wi-Fi settings, the native level (of custom curves) or the availability have changed."""
+        available = self.available
+        if available != self._written_available or self._device.changed(f"{self._key}.wifi") or self._device.changed(f"{self._key}.target_no_wifi"):
+            self._written_available = available
+            if profiler := self._device.hub.profiler:
+                profiler.entity_written()
+            self.async_write_ha_state()
+
+    @property
+    def extra_state_attributes(self):
+        attributes = {}
+        if self._device.stale:
+            attributes["stale"] = True
+        if self._key in self._device.holds:
+            attributes["held"] = True
+        return attributes or None
 
     @property
     def native_value(self):
-        v = self._device.get(f"{self._key}.wifi.valid")
-        if not v:
+        """The adjustment, or for other curves the current difference from the native level."""
+        if not self._device.get(f"{self._key}.wifi.valid"):
             return 0
-        p = self._device.get(f"{self._key}.wifi.points")
-        if len(p) == 2 and p[0] == [0, 0] and p[1][0] == 100:
-            return p[1][1] - 100
-        if len(p) == 2 and p[1] == [100, 100] and p[0][0] == 0:
-            return p[0][1]
-        return None
+        try:
+            curve = HomeVentilationControlFanCurve(self._device.get(f"{self._key}.wifi.points"))
+        except ValueError:
+            return None
+        if (value := curve.adjustment()) is not None:
+            return value
+        if (level := self._device.get(f"{self._key}.target_no_wifi")) is None:
+            return None
+        return round(curve(level) - level)
 
-    async def async_set_native_value(self, value: float) -> None:
-        if value < 0:
-            self._device.send({
-                f"wifi_{self._key}": [(0, 0), (100, round(value) + 100)],
-                f"wifi_{self._key}_ttl": self._MAX_LOW_TIME,
-            })
-        else:
-            self._device.send({
-                f"wifi_{self._key}": [(0, round(value)), (100, 100)],
-                f"wifi_{self._key}_ttl": self._MAX_HIGH_TIME,
+    async def _async_apply(self, curve: HomeVentilationControlFanCurve, hold: bool, duration: timedelta | None) -> None:
+        """Send the curve and wait for the device to apply it; then hold it or release any hold."""
+        duration = duration and duration.total_seconds()
+        ttl = curve.ttl()
+        self._device.release(self._key)
+        try:
+            await self._device.send_and_confirm({
+                f"wifi_{self._key}": curve.encode(),
+                # Without renewals, the device drops the curve when the duration ends.
+                f"wifi_{self._key}_ttl": curve.ttl(duration),
             })
+        except HomeVentilationControlSupersededException:
+            # A newer value is being applied, e.g. while a slider is dragged.
+            return
+        except HomeVentilationControlException as ex:
+            raise HomeAssistantError(f"{self._device.name} did not apply the {self.name}") from ex
+        if hold:
+            self._device.hold(self._key, curve.encode(), ttl, duration)
+        # Report the value the device has actually applied.
+        self.async_write_ha_state()
+
+    async def async_set_native_value(self, value: float) -> None:
+        await self._async_apply(HomeVentilationControlFanCurve.from_adjustment(value), False, None)
+
+    async def async_hold_value(self, value: float, duration: timedelta | None = None) -> None:
+        """Apply the adjustment and keep renewing it for duration, or until changed."""
+        await self._async_apply(HomeVentilationControlFanCurve.from_adjustment(value), True, duration)
+
+    async def async_set_curve(self, points: HomeVentilationControlFanCurve, hold: bool = False, duration: timedelta | None = None) -> None:
+        """Apply a whole curve in one command, held if hold or duration is given."""
+        await self._async_apply(points, hold or duration is not None, duration)
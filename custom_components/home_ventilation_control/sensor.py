@@ -2,7 +2,7 @@
 from __future__ import annotations
 
 from .lib import *
-from .entity import HomeVentilationControlEntity, async_setup_entry_with_type
+from .entity import HomeVentilationControlEntity, async_setup_entry_with_type, SENSOR_DESCRIPTIONS
 
 from homeassistant.components.sensor import SensorEntity
 from homeassistant.config_entries import ConfigEntry
@@ -16,7 +16,7 @@ async def async_setup_entry(
     async_add_entities: AddEntitiesCallback,
 ) -> None:
     """Set up sensors."""
-    await async_setup_entry_with_type(hass, config_entry, async_add_entities, HomeVentilationControlSensor)
+    await async_setup_entry_with_type(hass, config_entry, async_add_entities, HomeVentilationControlSensor, SENSOR_DESCRIPTIONS)
 
 
 class HomeVentilationControlSensor(HomeVentilationControlEntity, SensorEntity):
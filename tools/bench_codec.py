@@ -0,0 +1,71 @@
+"""Benchmark the JSON codecs on recorded HomeVentilationControl datagrams.
+
+Each round decodes every recorded datagram like the hub does and encodes
+one keepalive and one fan command like the device does. The datagrams are
+also measured in the compact format of a subscription to the paths which
+the entities enabled by default read.
+
+Usage: python tools/bench_codec.py [--payloads FILE] [--number N]
+"""
+
+import argparse, timeit
+
+from common import lib, load_payloads, PAYLOADS
+
+# The subscription of a device with the default entities (see entity.subscribed_paths).
+FIELDS = ["conf.name"] + [f"{fan}.{key}" for fan in ("0", "1") for key in ("target_no_wifi", "wifi.valid", "wifi.points", "wifi.ttl")] + [
+    "air.rh", "air.temperature",
+    "0.target", "0.percentage", "0.controller.level", "0.controller.unit",
+    "1.target", "1.percentage", "1.controller.level", "1.controller.unit", "1.ir.speed", "1.ir.light",
+]
+
+def compact(codec, payloads):
+    """The payloads as a device subscribed to FIELDS would send them."""
+    getters = [lib.compile_path(path) for path in FIELDS]
+    result = []
+    for payload in payloads:
+        data = codec.loads(payload)["HomeVentilationControl"]
+        values = [getter(data) for getter in getters]
+        result.append(codec.dumps({"HomeVentilationControl": {"unique_id": data["unique_id"], "fields_id": 0, "values": values}}))
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument("--payloads", default = PAYLOADS, help = "recorded datagrams, one per line")
+    parser.add_argument("--number", type = int, default = 500, help = "rounds over all datagrams")
+    args = parser.parse_args()
+
+    payloads = load_payloads(args.payloads)
+    unique_id = lib.STDLIB_CODEC.loads(payloads[0])["HomeVentilationControl"]["unique_id"]
+    keepalive = {"HomeVentilationControl": {"unique_id": unique_id}}
+    command = {"HomeVentilationControl": {"wifi_0": [(0, 10), (100, 100)], "wifi_0_ttl": 18 * 3600_000, "unique_id": unique_id}}
+
+    codecs = [c for c in (lib.STDLIB_CODEC, lib.ORJSON_CODEC) if c]
+    if not lib.ORJSON_CODEC:
+        print("orjson is not installed; only the stdlib codec is measured")
+
+    results = {}
+    for codec in codecs:
+        hub = lib.HomeVentilationControlHub(codec)
+        compact_payloads = compact(codec, payloads)
+        assert all(hub.decode(p) for p in payloads + compact_payloads)
+
+        def decode(payloads = payloads):
+            for payload in payloads:
+                hub.decode(payload)
+
+        def encode():
+            codec.dumps(keepalive)
+            codec.dumps(command)
+
+        decode_s = min(timeit.repeat(decode, number = args.number, repeat = 5)) / (args.number * len(payloads))
+        encode_s = min(timeit.repeat(encode, number = args.number, repeat = 5)) / (args.number * 2)
+        results[codec.name] = decode_s
+        compact_s = min(timeit.repeat(lambda: decode(compact_payloads), number = args.number, repeat = 5)) / (args.number * len(payloads))
+        print(f"{codec.name:>7}: decode {decode_s * 1e6:6.2f} us/packet ({1 / decode_s:9.0f} packets/s), encode {encode_s * 1e6:6.2f} us/request")
+        print(f"{'':>7}  compact: decode {compact_s * 1e6:6.2f} us/packet, {sum(map(len, compact_payloads)) / len(payloads):.0f} bytes/packet instead of {sum(map(len, payloads)) / len(payloads):.0f}")
+    if len(results) == 2:
+        print(f"orjson decodes {results['json'] / results['orjson']:.1f}x faster")
+
+if __name__ == "__main__":
+    main()
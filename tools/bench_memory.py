@@ -0,0 +1,52 @@
+"""Measure the memory used per device, keeping whole packets vs a layout.
+
+Usage: python tools/bench_memory.py [--devices N]
+"""
+
+import argparse, gc, tracemalloc
+
+from common import lib, load_payloads
+from bench_paths import KEYS
+
+# The paths the integration subscribes to (entity.DATA_LAYOUT).
+PATHS = ["conf.name"] + KEYS[:-1] + ["0.controller.unit", "1.controller.unit"] + [
+    f"{fan}.wifi.{key}" for fan in ("0", "1") for key in ("valid", "points", "ttl")
+]
+
+def measure(payloads, count, layout):
+    hub = lib.HomeVentilationControlHub()
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    devices = []
+    for i in range(count):
+        data = hub.decode(payloads[0])
+        data["unique_id"] = f"dev{i:05d}"
+        device = lib.HomeVentilationControlDevice(data, ("127.0.0.1", 40000 + i), hub)
+        device.set_layout(layout)
+        # Replace the initial data with a few pushed packets, like a running device.
+        for payload in payloads[1:4]:
+            data = hub.decode(payload)
+            data["unique_id"] = device.unique_id
+            device._received(data, device.address, len(payload))
+        devices.append(device)
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return used / count
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument("--devices", type = int, default = 500, help = "number of devices")
+    args = parser.parse_args()
+
+    payloads = load_payloads()
+    full = measure(payloads, args.devices, None)
+    layout = lib.HomeVentilationControlLayout(PATHS)
+    compact = measure(payloads, args.devices, layout)
+    print(f"whole packet: {full:8.0f} bytes per device")
+    print(f"layout:       {compact:8.0f} bytes per device ({len(layout.paths)} paths)")
+    print(f"saved:        {1 - compact / full:8.0%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Benchmark reading entity values: string-split device.get() vs compiled paths.
+
+Usage: python tools/bench_paths.py [--number N]
+"""
+
+import argparse, timeit
+
+from common import lib, load_data
+
+# The keys of the entity descriptions in entity.py.
+KEYS = [
+    "uptime", "air.rh", "air.temperature",
+    "0.on", "0.own", "0.target", "0.target_no_wifi", "0.percentage", "0.rpm",
+    "0.controller.level", "0.ir.speed", "0.wifi.valid", "0.controller.measured_level", "0.controller.millivolts",
+    "1.on", "1.own", "1.target", "1.target_no_wifi", "1.percentage", "1.rpm",
+    "1.controller.level", "1.ir.speed", "1.wifi.valid", "1.controller.measured_level", "1.controller.millivolts",
+    "1.ir.light", "0.missing.key",
+]
+
+def get_split(data, path):
+    """The original HomeVentilationControlDevice.get()."""
+    try:
+        d = data
+        for component in path.split("."):
+            d = d[component]
+        return d
+    except:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument("--number", type = int, default = 2000, help = "rounds over all keys")
+    args = parser.parse_args()
+
+    data = load_data()[0]
+    getters = [lib.compile_path(key) for key in KEYS]
+    assert [g(data) for g in getters] == [get_split(data, key) for key in KEYS]
+
+    def split():
+        for key in KEYS:
+            get_split(data, key)
+
+    def compiled():
+        for getter in getters:
+            getter(data)
+
+    reads = args.number * len(KEYS)
+    results = {}
+    for name, func in (("split", split), ("compiled", compiled)):
+        seconds = min(timeit.repeat(func, number = args.number, repeat = 5))
+        results[name] = seconds / reads * 1e9
+        print(f"{name:>10}: {results[name]:7.1f} ns per state read")
+    print(f"{'speedup':>10}: {results['split'] / results['compiled']:7.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+"""Shared helpers for the development tools in this directory.
+
+The integration's lib.py only depends on the standard library, so the
+tools import it directly instead of importing the Home Assistant package.
+"""
+
+import json, sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "custom_components" / "home_ventilation_control"))
+
+import lib
+
+PAYLOADS = Path(__file__).resolve().parent / "payloads.jsonl"
+
+def load_payloads(path = PAYLOADS) -> list[bytes]:
+    """Recorded datagrams, one JSON document per line."""
+    with open(path, "rb") as f:
+        return [line.strip() for line in f if line.strip()]
+
+def load_data(path = PAYLOADS) -> list[dict]:
+    """Recorded datagrams decoded to the "HomeVentilationControl" object."""
+    return [json.loads(p)["HomeVentilationControl"] for p in load_payloads(path)]
@@ -0,0 +1,82 @@
+"""Load test lib.py against many simulated devices on localhost.
+
+The simulated devices run in a separate process, so the CPU time measured
+here is spent by the hub and HomeVentilationControlDevice objects only.
+
+Usage: python tools/loadtest.py [--devices N] [--push-interval S] [--duration S]
+"""
+
+import argparse, asyncio, multiprocessing, statistics, time, tracemalloc
+
+from common import lib
+import simulator
+
+def run_simulator(count, port, push_interval, ready):
+    async def run():
+        await simulator.start_devices(count, port = port, push_interval = push_interval, timestamps = True)
+        ready.set()
+        await asyncio.Event().wait()
+    asyncio.run(run())
+
+async def run_client(args):
+    latencies = []
+
+    def updated(device):
+        if (sent := device.data.get("sim_sent")) is not None:
+            latencies.append(time.time() - sent)
+
+    hub = lib.HomeVentilationControlHub()
+    await hub.start()
+    addresses = [("127.0.0.1", args.port + i) for i in range(args.devices)]
+
+    tracemalloc.start()
+    memory_before = tracemalloc.get_traced_memory()[0]
+    t0 = time.perf_counter()
+    devices = [device async for device in hub.discover_iter(addresses, timeout = 10, settle = 2)]
+    for device in devices:
+        await device.start(updated)
+    discovery_s = time.perf_counter() - t0
+    await asyncio.sleep(1)
+    memory_per_device = (tracemalloc.get_traced_memory()[0] - memory_before) / max(len(devices), 1)
+    tracemalloc.stop()
+
+    latencies.clear()
+    packets_before = sum(d.stats.packets for d in devices)
+    cpu_before = time.process_time()
+    await asyncio.sleep(args.duration)
+    cpu = time.process_time() - cpu_before
+    packets = sum(d.stats.packets for d in devices) - packets_before
+
+    for device in devices:
+        device.close()
+    hub.close()
+
+    print(f"devices:        {len(devices)} of {args.devices} discovered and started in {discovery_s:.2f} s")
+    print(f"memory:         {memory_per_device / 1024:.1f} KiB per device")
+    print(f"packets:        {packets} in {args.duration:.0f} s ({packets / args.duration:.0f} per second)")
+    if packets:
+        print(f"cpu:            {cpu / packets * 1e6:.1f} us per packet")
+    if latencies:
+        latencies.sort()
+        print(f"latency:        median {statistics.median(latencies) * 1e3:.2f} ms, p99 {latencies[int(len(latencies) * 0.99)] * 1e3:.2f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument("--devices", type = int, default = 200, help = "number of simulated devices")
+    parser.add_argument("--port", type = int, default = 40000, help = "port of the first simulated device")
+    parser.add_argument("--push-interval", type = float, default = 1.0, help = "seconds between pushes of each device")
+    parser.add_argument("--duration", type = float, default = 10.0, help = "seconds to measure")
+    args = parser.parse_args()
+
+    ready = multiprocessing.Event()
+    process = multiprocessing.Process(target = run_simulator, args = (args.devices, args.port, args.push_interval, ready), daemon = True)
+    process.start()
+    try:
+        if not ready.wait(30):
+            raise SystemExit("simulator did not start")
+        asyncio.run(run_client(args))
+    finally:
+        process.terminate()
+
+if __name__ == "__main__":
+    main()
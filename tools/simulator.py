@@ -0,0 +1,179 @@
+"""Simulated HomeVentilationControl devices for testing lib.py without hardware.
+
+Each simulated device listens on its own UDP port and behaves like the
+firmware as far as the integration is concerned:
+
+* a request without unique_id is a discovery request and gets the whole
+  state, also if the sender is subscribed to compact packets,
+* a request with the device's unique_id is a keepalive: the sender is
+  subscribed to pushes for UPDATE_TIMEOUT seconds and gets a reply,
+* "udp_force_update" pushes the state to all subscribers at once,
+* "wifi_N" sets the points of fan N for "wifi_N_ttl" milliseconds,
+* "fields" (with "fields_id") subscribes the sender to compact packets
+  {"unique_id", "fields_id", "values"} with the values of those paths;
+  an empty list returns to whole packets.
+
+Usage: python tools/simulator.py [--count N] [--port PORT] [--push-interval S]
+"""
+
+import argparse, asyncio, copy, time
+
+from common import lib, load_data
+
+def interpolate(points, x):
+    """Evaluate a piecewise linear curve given as [[x, y], ...] at x."""
+    if not points:
+        return x
+    if x <= points[0][0]:
+        return points[0][1]
+    for (x0, y0), (x1, y1) in zip(points, points[1:]):
+        if x <= x1:
+            return y0 + (y1 - y0) * (x - x0) / (x1 - x0) if x1 != x0 else y1
+    return points[-1][1]
+
+class SimulatedDevice(asyncio.DatagramProtocol):
+    """One simulated device with its own socket."""
+
+    UPDATE_TIMEOUT = lib.HomeVentilationControlDevice.UPDATE_TIMEOUT
+
+    def __init__(self, unique_id, name, push_interval = 10.0, timestamps = False, codec = lib.DEFAULT_CODEC):
+        self.codec = codec
+        self.state = copy.deepcopy(load_data()[0])
+        self.state["unique_id"] = unique_id
+        self.state["conf"]["name"] = name
+        self.push_interval = push_interval
+        # Add the send time to pushes, for measuring end-to-end latency.
+        self.timestamps = timestamps
+        self.subscribers = {}
+        # Peer -> (getters, fields_id) of compact subscriptions.
+        self.fields = {}
+        self.requests = 0
+        self._wifi_expires = {}
+        self._time_started = time.monotonic()
+        self._clock_started = self.state["clock"]
+        self._transport = None
+        self._push_timer = None
+
+    @property
+    def unique_id(self):
+        return self.state["unique_id"]
+
+    def connection_made(self, transport):
+        self._transport = transport
+        self._schedule_push()
+
+    def connection_lost(self, ex):
+        if self._push_timer:
+            self._push_timer.cancel()
+
+    def datagram_received(self, packet, peer):
+        try:
+            request = self.codec.loads(packet)["HomeVentilationControl"]
+        except (ValueError, KeyError, TypeError):
+            return
+        self.requests += 1
+        if "unique_id" not in request:
+            # Discovery needs the whole state, whatever the sender subscribed to.
+            self._transport.sendto(self.payload(), peer)
+            return
+        if request["unique_id"] != self.unique_id:
+            return
+        self.subscribers[peer] = time.monotonic() + self.UPDATE_TIMEOUT
+        if (fields := request.get("fields")) is not None:
+            if fields:
+                self.fields[peer] = ([lib.compile_path(path) for path in fields], request.get("fields_id"))
+            else:
+                self.fields.pop(peer, None)
+        self.handle(request)
+        if request.get("udp_force_update"):
+            self.push()
+        else:
+            self._send(peer)
+
+    def handle(self, request):
+        """Apply the commands of a request."""
+        for fan in ("0", "1"):
+            if (points := request.get(f"wifi_{fan}")) is not None:
+                ttl = request.get(f"wifi_{fan}_ttl", 0)
+                self.state[fan]["wifi"] = {"valid": True, "points": [list(p) for p in points], "ttl": ttl}
+                self._wifi_expires[fan] = time.monotonic() + ttl / 1_000
+
+    def update(self):
+        """Advance clocks, expire Wi-Fi settings and recompute the fan targets."""
+        now = time.monotonic()
+        self.state["uptime"] = round((now - self._time_started) * 1_000)
+        self.state["clock"] = self._clock_started + self.state["uptime"]
+        for fan in ("0", "1"):
+            f = self.state[fan]
+            if (expires := self._wifi_expires.get(fan)) is not None:
+                if expires <= now:
+                    del self._wifi_expires[fan]
+                    f["wifi"] = {"valid": False, "points": [], "ttl": 0}
+                else:
+                    f["wifi"]["ttl"] = round((expires - now) * 1_000)
+            points = f["wifi"]["points"] if f["wifi"]["valid"] else []
+            f["target"] = f["percentage"] = round(interpolate(points, f["target_no_wifi"]))
+
+    def payload(self, fields = None):
+        """Encode the state, or the values of fields = (getters, fields_id) of a subscription."""
+        self.update()
+        if fields is None:
+            state = self.state
+        else:
+            getters, fields_id = fields
+            state = {"unique_id": self.unique_id, "fields_id": fields_id, "values": [getter(self.state) for getter in getters]}
+        if self.timestamps:
+            state = state | {"sim_sent": time.time()}
+        return self.codec.dumps({"HomeVentilationControl": state})
+
+    def _send(self, peer):
+        self._transport.sendto(self.payload(self.fields.get(peer)), peer)
+
+    def push(self):
+        """Send the state to all subscribers."""
+        now = time.monotonic()
+        self.subscribers = {peer: expires for peer, expires in self.subscribers.items() if expires > now}
+        self.fields = {peer: fields for peer, fields in self.fields.items() if peer in self.subscribers}
+        if self.subscribers:
+            payload = None
+            for peer in self.subscribers:
+                if peer in self.fields:
+                    self._transport.sendto(self.payload(self.fields[peer]), peer)
+                else:
+                    payload = payload or self.payload()
+                    self._transport.sendto(payload, peer)
+
+    def _schedule_push(self):
+        self.push()
+        self._push_timer = asyncio.get_running_loop().call_later(self.push_interval, self._schedule_push)
+
+async def start_devices(count, host = "127.0.0.1", port = 0, **kwargs) -> list[tuple[SimulatedDevice, tuple]]:
+    """Start count simulated devices on consecutive ports (or random ports if port is 0)."""
+    loop = asyncio.get_running_loop()
+    devices = []
+    for i in range(count):
+        device = SimulatedDevice(f"sim{i:05d}", f"Simulated {i}", **kwargs)
+        transport, _ = await loop.create_datagram_endpoint(lambda: device, local_addr = (host, port + i if port else 0))
+        devices.append((device, transport.get_extra_info("sockname")))
+    return devices
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument("--count", type = int, default = 1, help = "number of devices")
+    parser.add_argument("--host", default = "127.0.0.1", help = "address to listen on")
+    parser.add_argument("--port", type = int, default = lib.HomeVentilationControlDevice.DEFAULT_PORT, help = "port of the first device")
+    parser.add_argument("--push-interval", type = float, default = 10.0, help = "seconds between pushes")
+    args = parser.parse_args()
+
+    async def run():
+        for device, address in await start_devices(args.count, args.host, args.port, push_interval = args.push_interval):
+            print(device.unique_id, "listening on", address)
+        await asyncio.Event().wait()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()